@@ -0,0 +1,90 @@
+import os
+
+import pandas as pd
+
+import cube
+import emoji_engine
+import sentiment
+import word_index
+
+# Additive per-chat summaries: each table is a sum over messages, so the tables
+# for two slices of a chat merge into the tables for the whole chat.
+INDEXES = {
+    'activity': ['user', 'date', 'hour'],
+    'words': ['user', 'word'],
+    'emojis': ['user', 'emoji'],
+    'sentiment': ['user', 'sentiment'],
+}
+
+
+def activity(df):
+    return activity_table(cube.build(df))
+
+
+def activity_table(chat_cube):
+    return chat_cube.astype({'user': object}).set_index(INDEXES['activity'])
+
+
+def activity_cube(table):
+    # The inverse of activity_table.
+    return cube.compact(table.reset_index())
+
+
+def words(df):
+    members = df[df['user'] != 'group_notification']
+    table = word_index.term_frequencies(members['message'], members['user'].astype(object),
+                                        word_index.load_stopwords())
+    return table.to_frame()
+
+
+def emojis(df):
+    found = emoji_engine.extract(df['message'])
+    return emoji_engine.counts_by_user(df['user'].astype(object), found).rename('count').to_frame()
+
+
+def sentiment_counts(df):
+    labels = sentiment.label(sentiment.score_messages(df['message']))
+    return labels.groupby(df['user'].astype(object).rename('user')).value_counts().rename('messages').to_frame()
+
+
+BUILDERS = {
+    'activity': activity,
+    'words': words,
+    'emojis': emojis,
+    'sentiment': sentiment_counts,
+}
+
+
+def compute(df):
+    return {name: build(df) for name, build in BUILDERS.items()}
+
+
+def merge(tables, new_tables):
+    merged = {}
+    for name, table in new_tables.items():
+        if name in tables:
+            table = pd.concat([tables[name], table]).groupby(level=INDEXES[name], observed=True).sum()
+        merged[name] = table
+    return merged
+
+
+def _path(directory, name):
+    return os.path.join(directory, name + '.parquet')
+
+
+def save(directory, tables):
+    os.makedirs(directory, exist_ok=True)
+    for name, table in tables.items():
+        tmp_path = _path(directory, '.' + name)
+        table.reset_index().to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, _path(directory, name))
+
+
+def load(directory):
+    tables = {}
+    for name, index in INDEXES.items():
+        try:
+            tables[name] = pd.read_parquet(_path(directory, name)).set_index(index)
+        except (OSError, ValueError):
+            continue
+    return tables
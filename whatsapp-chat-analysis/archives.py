@@ -0,0 +1,56 @@
+import gzip
+import os
+import zipfile
+
+# Exports as WhatsApp writes them (.zip, with any attached media) or as they
+# are archived (.gz, .zst). The format is told from the first bytes, so a
+# renamed file still opens.
+SUFFIXES = ('.txt', '.zip', '.gz', '.zst')
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZIP_MAGIC = b'PK\x03\x04'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# The chat inside an iOS export; Android names it after the chat.
+IOS_CHAT_NAME = '_chat.txt'
+
+
+def chat_name(filename):
+    # 'WhatsApp Chat with Family.txt.gz' -> 'WhatsApp Chat with Family'
+    name = os.path.basename(filename)
+    for suffix in ('.gz', '.zst', '.zip', '.txt'):
+        name = name.removesuffix(suffix)
+    return name
+
+
+def _chat_member(archive):
+    texts = [info for info in archive.infolist()
+             if info.filename.endswith('.txt') and not info.is_dir() and '__MACOSX' not in info.filename]
+    if not texts:
+        raise ValueError("No chat .txt file in the archive")
+    for info in texts:
+        if os.path.basename(info.filename) == IOS_CHAT_NAME:
+            return info
+    return max(texts, key=lambda info: info.file_size)
+
+
+def _open_zstd(source):
+    import zstandard
+    return zstandard.ZstdDecompressor().stream_reader(source, read_across_frames=True, closefd=False)
+
+
+def open_export(source):
+    # source is a binary file object at offset 0. Returns a file object that
+    # reads the export text's bytes, decompressing only as much as each read
+    # asks for; an uncompressed source is returned as is. Closing the result
+    # leaves source open.
+    magic = source.read(4)
+    source.seek(0)
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.GzipFile(fileobj=source, mode='rb')
+    if magic == ZIP_MAGIC:
+        archive = zipfile.ZipFile(source)
+        return archive.open(_chat_member(archive))
+    if magic == ZSTD_MAGIC:
+        return _open_zstd(source)
+    return source
@@ -0,0 +1,209 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import aggregates
+import archives
+import cache
+import columnar
+import context
+import helper
+import links
+import preprocessor
+import profiling
+import sentiment
+
+MANIFEST = 'manifest.json'
+
+
+def _init_worker(profile=False):
+    # Files are already spread over the pool; nested pools would only
+    # oversubscribe the CPUs.
+    sentiment.POOL_MIN_MESSAGES = float('inf')
+    links.POOL_MIN_MESSAGES = float('inf')
+    if profile:
+        profiling.enable()
+
+
+def _json_default(value):
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+def _write_json(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(data, file, indent=2, ensure_ascii=False, default=_json_default)
+    os.replace(tmp_path, path)
+
+
+def chat_metrics(df, start_date, last_date):
+    # Sentiment and badges have no out-of-core version and are left out for
+    # datasets.
+    out_of_core = isinstance(df, columnar.ChatDataset)
+    num_messages, words, num_media_messages, num_links = helper.fetch_stats('Everyone', df)
+    user_counts = helper.user_message_counts('Everyone', df)
+    starters = helper.identify_conversation_starters('Everyone', df)
+    streak = helper.find_longest_consecutive_streak(df, 'Everyone')
+    sentiment_counts = None if out_of_core else helper.sentiment_analysis(df, 'Everyone')
+
+    metrics = {
+        'messages': num_messages,
+        'words': words,
+        'media': num_media_messages,
+        'links': num_links,
+        'start_date': start_date,
+        'last_date': last_date,
+        'most_active_user': helper.get_most_active_user(df),
+        'messages_by_user': user_counts.to_dict(),
+        'conversation_starts': dict(zip(starters['User'], starters['Conversation Starts'])),
+        'sentiment': {} if sentiment_counts is None else dict(zip(sentiment_counts['sentiment'], sentiment_counts['count'])),
+        'badges': helper.assign_chat_badges(df) if num_messages and not out_of_core else {},
+    }
+    if streak is not None:
+        metrics['longest_streak'] = {key: streak[key] for key in ('user', 'streak_length', 'start_time', 'end_time')}
+    return metrics
+
+
+def analyze_file(path, out_dir, options, out_of_core=False):
+    profiling.reset()
+    started = time.perf_counter()
+    stat = os.stat(path)
+    with open(path, 'rb') as file:
+        digest = cache.content_hash(file)
+        if out_of_core:
+            # The partitioned messages are kept as part of the output.
+            df = columnar.write_dataset(file, os.path.join(out_dir, 'messages'), options.get('chat_format'))
+            start_date, last_date = df.date_range()
+        else:
+            df, start_date, last_date = preprocessor.preprocess(file, **options)
+    parsed = time.perf_counter()
+
+    os.makedirs(out_dir, exist_ok=True)
+    if out_of_core:
+        tables = {'activity': aggregates.activity_table(context.analysis_context('Everyone', df).cube)}
+    else:
+        tables = aggregates.compute(df)
+    aggregates.save(out_dir, tables)
+    _write_json(os.path.join(out_dir, 'metrics.json'), chat_metrics(df, start_date, last_date))
+    finished = time.perf_counter()
+
+    if profiling.is_enabled():
+        profiling.export_json(os.path.join(out_dir, 'profile.json'))
+
+    return {
+        'hash': digest,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'messages': len(df),
+        'parse_seconds': parsed - started,
+        'analysis_seconds': finished - parsed,
+        'seconds': finished - started,
+    }
+
+
+def find_exports(input_dir, suffix=archives.SUFFIXES):
+    paths = []
+    for root, _, files in os.walk(input_dir):
+        paths.extend(os.path.join(root, name) for name in files if name.endswith(suffix))
+    return sorted(paths)
+
+
+def chat_output_dir(output_dir, name):
+    # 'family.txt' is written to 'family'; archives keep their whole name, so
+    # 'family.txt.gz' or 'family.zip' next to it never share its directory.
+    return os.path.join(output_dir, name.removesuffix('.txt'))
+
+
+def load_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST), encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def is_unchanged(entry, path, settings):
+    # Size and mtime decide without reading the file; a touched file whose
+    # content hash still matches is unchanged too.
+    if entry is None or entry['settings'] != settings:
+        return False
+    stat = os.stat(path)
+    if entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+        return True
+    with open(path, 'rb') as file:
+        if cache.content_hash(file) != entry['hash']:
+            return False
+    entry['mtime_ns'] = stat.st_mtime_ns
+    return True
+
+
+def run(input_dir, output_dir, workers=None, force=False, profile=False, out_of_core=False, **options):
+    settings = {'version': cache.CACHE_VERSION, 'out_of_core': out_of_core, **options}
+    manifest = load_manifest(output_dir)
+
+    pending = []
+    skipped = 0
+    for path in find_exports(input_dir):
+        name = os.path.relpath(path, input_dir)
+        if not force and is_unchanged(manifest.get(name), path, settings):
+            skipped += 1
+            continue
+        pending.append((name, path))
+
+    failures = 0
+    total_messages = 0
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(profile,)) as pool:
+        futures = {}
+        for name, path in pending:
+            out_dir = chat_output_dir(output_dir, name)
+            futures[pool.submit(analyze_file, path, out_dir, options, out_of_core)] = name
+
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                timing = future.result()
+            except Exception as e:
+                failures += 1
+                print(f"  {name}: failed: {e}", file=sys.stderr)
+                continue
+
+            manifest[name] = {'settings': settings, **timing}
+
+            total_messages += timing['messages']
+            rate = timing['messages'] / timing['seconds'] if timing['seconds'] else 0
+            print(f"  {name}: {timing['messages']} messages, parse {timing['parse_seconds']:.2f}s, "
+                  f"analysis {timing['analysis_seconds']:.2f}s, {rate:,.0f} msg/s")
+
+    elapsed = time.perf_counter() - started
+    os.makedirs(output_dir, exist_ok=True)
+    _write_json(os.path.join(output_dir, MANIFEST), manifest)
+
+    done = len(pending) - failures
+    rate = total_messages / elapsed if elapsed else 0
+    print(f"{done} analyzed, {failures} failed, {skipped} unchanged; "
+          f"{total_messages} messages in {elapsed:.2f}s ({rate:,.0f} msg/s)")
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Analyze every chat export in a directory")
+    parser.add_argument('input_dir')
+    parser.add_argument('output_dir')
+    parser.add_argument('-j', '--workers', type=int, default=None, help="processes (default: one per CPU)")
+    parser.add_argument('--format', dest='chat_format', choices=sorted(preprocessor.FORMATS), default=None)
+    parser.add_argument('--compact', action='store_true', help="use the compact in-memory frame")
+    parser.add_argument('--force', action='store_true', help="reanalyze files even if unchanged")
+    parser.add_argument('--profile', action='store_true', help="write per-stage timings to <chat>/profile.json")
+    parser.add_argument('--out-of-core', action='store_true',
+                        help="write messages to <chat>/messages as Parquet and query them with DuckDB")
+    args = parser.parse_args()
+
+    failures = run(args.input_dir, args.output_dir, args.workers, args.force, args.profile, args.out_of_core,
+                   chat_format=args.chat_format, compact=args.compact)
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,838 @@
+import argparse
+import contextlib
+import datetime
+import gzip
+import io
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+
+import emoji
+import numpy as np
+import pandas as pd
+import zstandard
+from scipy.ndimage import gaussian_filter
+
+import aggregates
+import batch
+import cache
+import columnar
+import cube
+import emoji_engine
+import helper
+import incremental
+import links
+import preprocessor
+import synthetic
+import word_cloud
+import workspace
+
+
+def timed(fn, *args, repeat=3):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def split_authors_loop(user_message):
+    # The per-row split preprocess used before split_authors, kept as the baseline.
+    users = []
+    messages = []
+    for message in user_message:
+        entry = re.split(r'([\w\W]+?):\s', message)
+        if entry[1:]:
+            users.append(entry[1])
+            messages.append(" ".join(entry[2:]))
+        else:
+            users.append('group_notification')
+            messages.append(entry[0])
+    return users, messages
+
+
+def bench_author_split(n):
+    user_message = synthetic.user_messages(messages=n)
+
+    loop_time, (loop_users, loop_messages) = timed(split_authors_loop, user_message)
+    vector_time, (users, messages) = timed(preprocessor.split_authors, user_message)
+
+    assert users.tolist() == loop_users
+    assert messages.tolist() == loop_messages
+
+    print(f"author split, {n} messages")
+    print(f"  re.split loop   {loop_time:8.3f}s")
+    print(f"  split_authors   {vector_time:8.3f}s  ({loop_time / vector_time:.1f}x)")
+
+
+def bench_formats(n):
+    print(f"timestamp formats, {n} messages")
+    for name in preprocessor.FORMATS:
+        # Starts on the 25th so day-first and month-first exports can be told apart.
+        data = synthetic.generate(messages=n, chat_format=name, start=datetime.datetime(2021, 1, 25, 9))
+
+        detected = preprocessor.detect_format(data[:preprocessor.SNIFF_SIZE].splitlines(keepends=True))
+        assert detected == name, (name, detected)
+
+        elapsed, (df, _, _) = timed(preprocessor.preprocess, data, name, repeat=1)
+        assert len(df) == n and df['date'].notna().all()
+
+        print(f"  {name:24s} {elapsed:8.3f}s  {n / elapsed:12,.0f} msg/s")
+
+    # Starting on March 1st, the first few KB of a month-first export parse
+    # either way; the order is only settled by the first date past the 12th.
+    data = synthetic.generate(messages=3_000, days=60, chat_format='android_12h_mdy',
+                              start=datetime.datetime(2021, 3, 1))
+    df, _, _ = preprocessor.preprocess(data)
+    assert len(df) == 3_000 and df['date'].notna().all()
+    assert df['date'].min() >= pd.Timestamp(2021, 3, 1)
+
+    ios = ('[12/01/2021, 10:01:00] Alice: look\n'
+           '\u200e[12/01/2021, 10:02:00] Bob: \u200eimage omitted\n'
+           '[12/01/2021, 10:03:00] Alice: nice\n')
+    df, _, _ = preprocessor.preprocess(ios, 'ios_24h_dmy_4y')
+    assert df['user'].tolist() == ['Alice', 'Bob', 'Alice'], df['user'].tolist()
+    assert df['message'][1] == '\u200eimage omitted\n'
+
+
+def bench_memory(n):
+    data = synthetic.generate(messages=n)
+    modes = {
+        'default': {},
+        'compact': {'compact': True},
+        'compact+arrow': {'compact': True, 'arrow_messages': True},
+    }
+    usage = {}
+    for mode, options in modes.items():
+        df, _, _ = preprocessor.preprocess(data, **options)
+        usage[mode] = df.memory_usage(deep=True, index=False)
+
+    report = pd.DataFrame(usage) / 2 ** 20
+    report.loc['total'] = report.sum()
+
+    print(f"frame memory (MiB), {n} messages")
+    print(report.round(2).to_string())
+
+
+def calendar_columns_apply(df):
+    # The string-formatting derivation preprocess used before add_calendar_columns.
+    df['only_date'] = df['date'].dt.date
+    df['year'] = df['date'].dt.year
+    df['month_num'] = df['date'].dt.month
+    df['month'] = df['date'].dt.month_name()
+    df['day'] = df['date'].dt.day
+    df['day_name'] = df['date'].dt.day_name()
+    df['hour'] = df['date'].dt.hour
+    df['minute'] = df['date'].dt.minute
+    df['period'] = df['hour'].apply(lambda h: f"{h}-00" if h == 23 else f"00-{h + 1}" if h == 0 else f"{h}-{h + 1}")
+    return df
+
+
+def bench_calendar(n):
+    rng = np.random.default_rng(0)
+    seconds = np.sort(rng.integers(0, 5 * 365 * 86400, n))
+    dates = pd.Timestamp('2020-01-01') + pd.to_timedelta(seconds, unit='s')
+    frame = pd.DataFrame({'date': dates})
+
+    apply_time, expected = timed(calendar_columns_apply, frame.copy(), repeat=1)
+    lookup_time, df = timed(preprocessor.add_calendar_columns, frame.copy(), repeat=1)
+    compact_time, _ = timed(preprocessor.add_calendar_columns, frame.copy(), True, repeat=1)
+
+    for column in ('month', 'day_name', 'period'):
+        assert df[column].astype(object).equals(expected[column])
+
+    print(f"calendar columns, {n} rows")
+    print(f"  dt accessors + apply       {apply_time:8.3f}s")
+    print(f"  code lookups               {lookup_time:8.3f}s  ({apply_time / lookup_time:.1f}x)")
+    print(f"  code lookups, compact      {compact_time:8.3f}s  ({apply_time / compact_time:.1f}x)")
+
+
+def synthetic_emoji_messages(n, seed=0):
+    rng = random.Random(seed)
+    bodies = [
+        'hello there friend how are you doing today',
+        'ok see you at 5',
+        'lol 😂😂',
+        'nice one 👍🏽',
+        'family trip 👨‍👩‍👧 🇮🇳',
+        'café later?',
+        '<Media omitted>',
+        # A dangling joiner or variation selector, as keyboards leave them.
+        'typo 😂\u200d',
+        'thumbs 👍🏽\u200d up',
+        'ok\ufe0f fine',
+    ]
+    return pd.Series([rng.choice(bodies) + '\n' for _ in range(n)])
+
+
+def emoji_char_loop(messages):
+    # The per-character scan emoji_helper and assign_chat_badges used before.
+    emojis = []
+    for message in messages:
+        emojis.extend([c for c in message if c in emoji.EMOJI_DATA])
+    return emojis
+
+
+def bench_emoji(n):
+    messages = synthetic_emoji_messages(n)
+    users = pd.Series(np.arange(n) % 7, index=messages.index)
+
+    loop_time, _ = timed(emoji_char_loop, messages)
+    extract_time, found = timed(emoji_engine.extract, messages)
+    by_user_time, _ = timed(emoji_engine.counts_by_user, users, found)
+    replace_time, expected = timed(lambda: messages.map(lambda text: emoji.replace_emoji(text, replace='')), repeat=1)
+    strip_time, stripped = timed(emoji_engine.strip, messages)
+
+    assert stripped.equals(expected)
+    assert '👨\u200d👩\u200d👧' in set(found)
+
+    print(f"emoji, {n} messages")
+    print(f"  char loop extract          {loop_time:8.3f}s  {n / loop_time:12,.0f} msg/s")
+    print(f"  trie extract               {extract_time:8.3f}s  {n / extract_time:12,.0f} msg/s")
+    print(f"  per-user counts            {by_user_time:8.3f}s")
+    print(f"  emoji.replace_emoji strip  {replace_time:8.3f}s  {n / replace_time:12,.0f} msg/s")
+    print(f"  trie strip                 {strip_time:8.3f}s  {n / strip_time:12,.0f} msg/s")
+
+    # emoji_helper and assign_chat_badges each scanned every message, and the
+    # word cloud stripped them again; the engine extracts once and strips once.
+    old_total = 2 * loop_time + replace_time
+    new_total = extract_time + by_user_time + strip_time
+    print(f"  three panels, before       {old_total:8.3f}s")
+    print(f"  three panels, engine       {new_total:8.3f}s  ({old_total / new_total:.1f}x)")
+
+
+def synthetic_link_messages(n, seed=0):
+    rng = random.Random(seed)
+    bodies = [
+        'hello there friend how are you doing today',
+        'ok',
+        'haha yes',
+        'see you at 5. bring snacks',
+        'check https://example.com/watch?v=abc123',
+        'docs at example.org/guide and www.python.org',
+        'meeting moved to 3:30',
+        'e.g. the 1.5 hour slot',
+        'dev server on http://localhost:8000',
+        'go to 192.168.1.1/admin now',
+        'slides are up on bit.ly/x9',
+        '<Media omitted>',
+    ]
+    return pd.Series([f'{rng.choice(bodies)} {rng.randrange(n // 10 + 1)}\n' for _ in range(n)])
+
+
+def urls_loop(messages):
+    # The per-message URLExtract scan fetch_stats used before.
+    extractor = links._get_extractor()
+    found = []
+    for message in messages:
+        found.extend(extractor.find_urls(message))
+    return found
+
+
+def bench_links(n):
+    messages = synthetic_link_messages(n)
+    users = pd.Series(np.arange(n) % 7, index=messages.index)
+
+    loop_time, expected = timed(urls_loop, messages, repeat=1)
+    links.find_urls.cache_clear()
+    prefilter_time, found = timed(links.extract, messages, 1, repeat=1)
+    links.find_urls.cache_clear()
+    pool_time, pooled = timed(links.extract, messages, None, repeat=1)
+    by_user_time, by_user = timed(links.counts_by_user, users, found)
+
+    assert found.tolist() == expected
+    assert pooled.tolist() == expected
+    assert {'192.168.1.1/admin', 'bit.ly/x9'} <= set(expected)
+    assert by_user.sum() == len(expected)
+
+    print(f"links, {n} messages, {len(expected)} urls")
+    print(f"  find_urls on every message {loop_time:8.3f}s  {n / loop_time:12,.0f} msg/s")
+    print(f"  prefilter + cache          {prefilter_time:8.3f}s  {n / prefilter_time:12,.0f} msg/s")
+    print(f"  prefilter + cache + pool   {pool_time:8.3f}s  {n / pool_time:12,.0f} msg/s")
+    print(f"  per-user counts            {by_user_time:8.3f}s")
+
+
+def full_refresh(data):
+    df, _, _ = preprocessor.preprocess(data)
+    return df, aggregates.compute(df)
+
+
+def bench_incremental(n):
+    # A weekly re-export: the previous export plus 5% new messages.
+    data = synthetic.generate(messages=n)
+    lines = data.splitlines(keepends=True)
+    # The old export ends at a message boundary, as a real earlier export does.
+    pattern = preprocessor.FORMATS[preprocessor.DEFAULT_FORMAT]['pattern']
+    cut = next(i for i in range(len(lines) * 95 // 100, 0, -1) if pattern.match(lines[i]))
+    previous = ''.join(lines[:cut])
+
+    incremental.CHATS_DIR = tempfile.mkdtemp()
+    try:
+        full_time, (expected, expected_tables) = timed(full_refresh, data, repeat=1)
+        first_time, (known, _, _, _) = timed(incremental.ingest, previous, repeat=1)
+        refresh_time, (df, _, _, tables) = timed(incremental.ingest, data, repeat=1)
+        # Only the new tail was parsed, not the whole export again.
+        meta = cache.load_meta(incremental.chat_dir(incremental.identify(data)))
+    finally:
+        shutil.rmtree(incremental.CHATS_DIR)
+
+    assert len(meta['parts']) == 2, meta['parts']
+
+    pd.testing.assert_frame_equal(df, expected)
+    for name, table in expected_tables.items():
+        assert table.sort_index().equals(tables[name].sort_index()), name
+
+    print(f"incremental ingestion, {n} messages, {n - len(known)} new")
+    print(f"  full parse + aggregates    {full_time:8.3f}s")
+    print(f"  first ingest (95%)         {first_time:8.3f}s")
+    print(f"  refresh with new tail      {refresh_time:8.3f}s")
+
+
+def panels_from_rows(df):
+    return (
+        df.groupby(['year', 'month_num'])['message'].count(),
+        df.groupby('only_date')['message'].count(),
+        df.groupby([df['date'].dt.dayofweek, df['hour']])['message'].count(),
+        df.groupby([df['date'].dt.dayofweek, df['user']])['msg_length'].sum(),
+    )
+
+
+def panels_from_cube(chat_cube):
+    return (
+        cube.by_month(chat_cube),
+        cube.by_date(chat_cube),
+        cube.by_weekday_hour(chat_cube),
+        cube.by_weekday_user(chat_cube, 'msg_length'),
+    )
+
+
+def bench_cube(n):
+    df, _, _ = preprocessor.preprocess(synthetic.generate(messages=n))
+
+    rows_time, expected = timed(panels_from_rows, df)
+    build_time, chat_cube = timed(cube.build, df)
+    rollup_time, rolled = timed(panels_from_cube, chat_cube)
+
+    for want, got in zip(expected, rolled):
+        assert want.tolist() == got.tolist()
+
+    print(f"activity cube, {n} messages, {len(chat_cube)} cube rows")
+    print(f"  panels from message rows   {rows_time:8.3f}s")
+    print(f"  cube build (once)          {build_time:8.3f}s")
+    print(f"  panels from cube           {rollup_time:8.3f}s")
+
+
+# The gap helpers as baseline helper.py had them, minus the chart. Their
+# quicksorts reorder messages that share a timestamp, so they only agree with
+# segmentation on frames without such ties.
+def baseline_conversation_starters(selected_user, df, gap_minutes=30):
+    df = df[df['user'] != 'group_notification']
+
+    if selected_user != 'Everyone':
+        df = df[df['user'] == selected_user]
+
+    df['date'] = pd.to_datetime(df['date'])
+
+    df = df.sort_values(by='date')
+
+    df['time_diff'] = df['date'].diff().dt.total_seconds() / 60
+
+    df['conversation_start'] = df['time_diff'] > gap_minutes
+
+    conversation_starters = df[df['conversation_start']]['user']
+
+    starter_counts = conversation_starters.value_counts().reset_index()
+    starter_counts.columns = ['User', 'Conversation Starts']
+
+    return starter_counts
+
+
+def baseline_silent_periods(selected_user, df):
+    if selected_user != 'Everyone':
+        df = df[df['user'] == selected_user]
+    df['gap_hours'] = df['date'].diff().dt.total_seconds() / 3600  # Convert gap to hours
+    silent_periods = df['gap_hours'][df['gap_hours'] > 1]  # Filter gaps > 1 hour
+    return silent_periods
+
+
+def baseline_longest_streak(df, selected_user):
+    if selected_user != 'Everyone':
+        df = df[df['user'] == selected_user]
+
+    if df.empty:
+        return None
+
+    df = df.sort_values('date')
+
+    df['author_change'] = (df['user'] != df['user'].shift()).cumsum()
+
+    grouped = df.groupby(['user', 'author_change'])
+
+    streak_info = grouped.size().reset_index(name='streak_length')
+    longest_streak = streak_info.loc[streak_info['streak_length'].idxmax()]
+
+    return {'user': longest_streak['user'], 'streak_length': longest_streak['streak_length']}
+
+
+def baseline_median_response_times(df, selected_user):
+    df = df[df['user'] != 'group_notification']
+
+    if selected_user != 'Everyone':
+        df = df[df['user'] == selected_user]
+
+    df = df.sort_values(["date", "user"])
+    df['time_diff'] = df['date'].diff().dt.total_seconds()
+    df['same_author'] = df['user'] == df['user'].shift()
+
+    response_data = df[~((df['time_diff'] < 180) & df['same_author'])]
+
+    response_data['response_time'] = response_data['time_diff'] / 60
+
+    median_response_time = response_data.groupby('user')['response_time'].median().reset_index()
+
+    return median_response_time
+
+
+def gap_analyses_baseline(df, selected_user):
+    with pd.option_context('mode.chained_assignment', None):
+        streak = baseline_longest_streak(df, selected_user)
+        return (
+            baseline_conversation_starters(selected_user, df).set_index('User')['Conversation Starts'],
+            baseline_silent_periods(selected_user, df.copy()),
+            (streak['user'], streak['streak_length']),
+            baseline_median_response_times(df, selected_user).set_index('user')['response_time'],
+        )
+
+
+def gap_analyses_segmented(df, selected_user):
+    streak = helper.find_longest_consecutive_streak(df, selected_user)
+    return (
+        helper.identify_conversation_starters(selected_user, df).set_index('User')['Conversation Starts'],
+        helper.calculate_silent_periods(selected_user, df),
+        (streak['user'], streak['streak_length']),
+        helper.median_response_times(selected_user, df).set_index('user')['response_time'],
+    )
+
+
+def gap_differences(expected, found):
+    # How many starter counts, silent periods and medians differ, and whether
+    # the streak does.
+    starters = expected[0].sort_index().compare(found[0].sort_index().rename(expected[0].name))
+    silent = expected[1].index.symmetric_difference(found[1].index)
+    medians = ~np.isclose(expected[3].sort_index(), found[3].sort_index(), equal_nan=True)
+    return len(starters), len(silent), int(expected[2] != found[2]), int(medians.sum())
+
+
+def bench_segmentation(n):
+    df, _, _ = preprocessor.preprocess(synthetic.generate(messages=n))
+
+    baseline_time, _ = timed(gap_analyses_baseline, df, 'Everyone', repeat=1)
+    # Segments are memoized per frame, so only the first call is a fair timing.
+    segmented_time, _ = timed(gap_analyses_segmented, df, 'Everyone', repeat=1)
+
+    # Without tied timestamps the results are the baseline's exactly.
+    untied = df.drop_duplicates('date')
+    for user in ('Everyone', 'Alice'):
+        expected = gap_analyses_baseline(untied, user)
+        found = gap_analyses_segmented(untied, user)
+        assert gap_differences(expected, found) == (0, 0, 0, 0), user
+        assert expected[1].equals(found[1].sort_index())
+
+    tied = gap_differences(gap_analyses_baseline(df, 'Everyone'), gap_analyses_segmented(df, 'Everyone'))
+
+    print(f"gap analyses, {n} messages")
+    print(f"  baseline helpers           {baseline_time:8.3f}s")
+    print(f"  one segmentation pass      {segmented_time:8.3f}s")
+    print(f"  with tied timestamps: {tied[0]} starter counts, {tied[1]} silent periods, {tied[2]} streak and "
+          f"{tied[3]} medians differ from the baseline")
+
+
+def smoothed_daily_dense(df, years=3):
+    # The unstack/resample path, summing every message rather than the first
+    # per timestamp.
+    year = df['date'].dt.year
+    daily = df.loc[year > year.max() - years].groupby(['user', 'date'], observed=True)['msg_length'].sum()
+    daily = daily.unstack(level=0).resample('D').sum().fillna(0)
+    return pd.DataFrame(gaussian_filter(daily.astype(float), (6, 0)), index=daily.index, columns=daily.columns)
+
+
+def traced(fn, *args):
+    tracemalloc.start()
+    try:
+        elapsed, result = timed(fn, *args, repeat=1)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return elapsed, peak / 2 ** 20, result
+
+
+def bench_smoothing(n, users=300):
+    df, _, _ = preprocessor.preprocess(synthetic.generate(messages=n, users=users, days=1500))
+
+    dense_time, dense_peak, expected = traced(smoothed_daily_dense, df)
+    # Includes building the activity cube, which later sections reuse.
+    sparse_time, sparse_peak, found = traced(helper.smoothed_daily_activity, 'Everyone', df)
+    top_time, top_peak, top = traced(helper.smoothed_daily_activity, 'Everyone', df, 3, 10)
+
+    assert list(expected.columns) == list(found.columns) and expected.index.equals(found.index)
+    assert np.allclose(expected.to_numpy(), found.to_numpy())
+    assert top.shape[1] == 11 and np.allclose(top.sum(axis=1), found.sum(axis=1))
+
+    print(f"smoothed daily activity, {n} messages, {users} users, {found.shape[0]} days")
+    print(f"  unstack + resample         {dense_time:8.3f}s {dense_peak:9.1f} MiB")
+    print(f"  bincount over the cube     {sparse_time:8.3f}s {sparse_peak:9.1f} MiB")
+    print(f"  top 10 users + others      {top_time:8.3f}s {top_peak:9.1f} MiB")
+
+
+def time_of_day_melted(df):
+    # The reindex/pad/melt path: one chart row per user per minute.
+    a = df.groupby([df['date'].dt.hour, df['date'].dt.minute, 'user'], observed=True)['msg_length'].sum()
+    a = a.unstack(fill_value=0)
+    a = a.reindex(pd.MultiIndex.from_product([range(24), range(60)], names=['hour', 'minute']), fill_value=0)
+    a = pd.concat([a.tail(120), a, a.head(120)]).astype(float)
+    smoothed = pd.DataFrame(gaussian_filter(a.to_numpy(), (3, 0)), index=a.index, columns=a.columns).iloc[120:-120]
+    return smoothed.reset_index().melt(id_vars=['hour', 'minute'], var_name='user', value_name='activity')
+
+
+def bench_time_of_day(n, users=300):
+    df, _, _ = preprocessor.preprocess(synthetic.generate(messages=n, users=users))
+    # A header that failed to parse leaves a message without a date.
+    df.loc[0, 'date'] = pd.NaT
+
+    melted_time, melted = timed(time_of_day_melted, df, repeat=1)
+    curves_time, curves = timed(helper.time_of_day_activity, 'Everyone', df, repeat=1)
+    chart_time, chart = timed(helper.activity_time_of_day_ts, 'Everyone', df, repeat=1)
+
+    expected = melted.pivot_table(index=['hour', 'minute'], columns='user', values='activity', sort=True)
+    assert list(expected.columns) == list(curves.columns)
+    assert np.allclose(expected.to_numpy(), curves.to_numpy())
+
+    print(f"time of day activity, {n} messages, {users} users")
+    print(f"  reindex + pad + melt       {melted_time:8.3f}s {len(melted):9d} chart rows")
+    print(f"  1440 x users bincount      {curves_time:8.3f}s")
+    print(f"  top 10, 5 minute chart     {chart_time:8.3f}s {len(chart.data):9d} chart rows")
+
+
+def import_seconds(statement, repeat=5):
+    # Best wall time of a fresh interpreter running the statement, so every
+    # run pays the full cold import.
+    here = os.path.dirname(os.path.abspath(__file__))
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', statement], cwd=here, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_imports(n):
+    interpreter = import_seconds('pass')
+    print("cold start imports (interpreter startup subtracted)")
+    print(f"  python                     {interpreter:8.3f}s")
+    for name, statement in (('helper', 'import helper'), ('app (main.py)', 'import main')):
+        print(f"  {name:26s} {import_seconds(statement) - interpreter:8.3f}s")
+
+
+def bench_word_cloud(n):
+    df, _, _ = preprocessor.preprocess(synthetic.generate(messages=n))
+    # Builds the word index up front, so only rendering is timed.
+    helper.word_cloud_frequencies('Everyone', df)
+
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        word_cloud.WORD_CLOUD_DIR = scratch_dir
+        frequencies = helper.word_cloud_frequencies('Everyone', df)
+
+        preview_time, preview = timed(lambda: word_cloud.render(frequencies, preview=True))
+        full_time, full = timed(word_cloud.render, frequencies, repeat=1)
+        cached_time, cached = timed(word_cloud.render, frequencies)
+        user_time, _ = timed(helper.create_word_cloud, df, 'Alice', repeat=1)
+
+        assert preview.size == full.size == cached.size == (word_cloud.WIDTH, word_cloud.HEIGHT)
+        assert list(full.getdata()) == list(cached.getdata())
+
+    print(f"word cloud, {n} messages")
+    print(f"  low resolution preview     {preview_time:8.3f}s")
+    print(f"  full render                {full_time:8.3f}s")
+    print(f"  cached render              {cached_time:8.3f}s")
+    print(f"  one user, uncached         {user_time:8.3f}s")
+
+
+OUT_OF_CORE_CALLS = """
+import helper
+helper.fetch_stats('Everyone', df)
+helper.most_busy_users('Everyone', df)
+helper.monthly_timeline('Everyone', df)
+helper.daily_timeline('Everyone', df)
+helper.activity_heatmap('Everyone', df)
+helper.identify_conversation_starters('Everyone', df)
+helper.find_longest_consecutive_streak(df, 'Everyone')
+"""
+
+
+PEAK_RSS = """
+with open('/proc/self/status') as status:
+    print(next(line.split()[1] for line in status if line.startswith('VmHWM')))
+"""
+
+
+def peak_rss_mib(setup, calls=OUT_OF_CORE_CALLS):
+    # Runs in a fresh interpreter, so the peak covers only this backend; DuckDB
+    # allocates outside Python, where tracemalloc cannot see. A forked child
+    # inherits this process's high-water mark, so the child resets it first
+    # (Linux only).
+    code = "open('/proc/self/clear_refs', 'w').write('5')\n" + setup + calls + PEAK_RSS
+    here = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run([sys.executable, '-c', code], cwd=here, check=True, capture_output=True, text=True)
+    return int(result.stdout.split()[-1]) / 1024
+
+
+def out_of_core_results(df):
+    return (
+        helper.fetch_stats('Everyone', df),
+        helper.user_message_counts('Everyone', df),
+        helper.monthly_timeline('Everyone', df),
+        helper.daily_timeline('Everyone', df),
+        helper.activity_heatmap('Everyone', df),
+        helper.identify_conversation_starters('Everyone', df),
+        helper.find_longest_consecutive_streak(df, 'Everyone')['streak_messages'],
+        helper.median_response_times('Everyone', df),
+    )
+
+
+def bench_out_of_core(n):
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        path = os.path.join(scratch_dir, 'chat.txt')
+        synthetic.write_export(path, messages=n, users=50)
+
+        with open(path, 'rb') as file:
+            parse_time, (df, _, _) = timed(preprocessor.preprocess, file, repeat=1)
+        with open(path, 'rb') as file:
+            write_time, dataset = timed(columnar.write_dataset, file, os.path.join(scratch_dir, 'dataset'), repeat=1)
+
+        memory_time, expected = timed(out_of_core_results, df, repeat=1)
+        links.find_urls.cache_clear()
+        query_time, found = timed(out_of_core_results, dataset, repeat=1)
+
+        assert expected[0] == found[0]
+        assert list(expected[1].items()) == list(found[1].items())
+        for want, got in zip(expected[2:], found[2:]):
+            pd.testing.assert_frame_equal(want.reset_index(drop=True), got.reset_index(drop=True), check_dtype=False)
+
+        memory_peak = peak_rss_mib(f"import preprocessor\ndf = preprocessor.preprocess(open({path!r}, 'rb'))[0]\n")
+        dataset_peak = peak_rss_mib(f"import columnar\ndf = columnar.ChatDataset({dataset.path!r})\n")
+
+    print(f"out-of-core backend, {n} messages")
+    print(f"  preprocess to a frame      {parse_time:8.3f}s")
+    print(f"  write Parquet dataset      {write_time:8.3f}s")
+    print(f"  helpers on the frame       {memory_time:8.3f}s {memory_peak:9.1f} MiB peak RSS (with parse)")
+    print(f"  helpers as DuckDB queries  {query_time:8.3f}s {dataset_peak:9.1f} MiB peak RSS")
+
+
+def cross_chat_views(frames):
+    # The cross-chat views recomputed from every chat's messages, as the
+    # workspace would have to without its index.
+    df = pd.concat([frame[['user', 'date']].assign(chat=name) for name, frame in frames.items()], ignore_index=True)
+    df = df.dropna(subset=['date'])
+    by_user = df.groupby(['user', 'chat']).size().unstack(fill_value=0)
+    timeline = df.groupby([df['date'].dt.to_period('M').dt.start_time.rename('period'), 'chat']).size()
+    return by_user, timeline.unstack(fill_value=0)
+
+
+def workspace_views(chats):
+    return chats.user_activity(), chats.volume_timeline(), chats.top_users(), chats.sentiment_by_chat()
+
+
+def bench_workspace(n, chat_count=8):
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        incremental.CHATS_DIR = os.path.join(scratch_dir, 'chats')
+        paths = {}
+        for number in range(chat_count):
+            paths[f'chat {number}'] = os.path.join(scratch_dir, f'chat-{number}.txt')
+            synthetic.write_export(paths[f'chat {number}'], messages=n // chat_count, users=5 + 5 * number,
+                                   seed=number)
+
+        def reparse():
+            frames = {}
+            for name, path in paths.items():
+                with open(path, 'rb') as file:
+                    frames[name] = preprocessor.preprocess(file)[0]
+            return cross_chat_views(frames)
+
+        def add_all(chats):
+            for name, path in paths.items():
+                with open(path, 'rb') as file:
+                    chats.add(file, name)
+
+        def reopen():
+            return workspace_views(workspace.Workspace(os.path.join(scratch_dir, 'workspace')))
+
+        reparse_time, (by_user, timeline) = timed(reparse, repeat=1)
+        add_time, _ = timed(add_all, workspace.Workspace(os.path.join(scratch_dir, 'workspace')), repeat=1)
+        readd_time, _ = timed(add_all, workspace.Workspace(os.path.join(scratch_dir, 'workspace')), repeat=1)
+        open_time, (user_activity, volume_timeline, _, _) = timed(reopen)
+        view_time, _ = timed(workspace_views, workspace.Workspace(os.path.join(scratch_dir, 'workspace')))
+
+    pd.testing.assert_frame_equal(user_activity.sort_index().sort_index(axis=1), by_user.sort_index().sort_index(axis=1),
+                                  check_dtype=False, check_names=False)
+    pd.testing.assert_frame_equal(volume_timeline, timeline, check_dtype=False, check_names=False)
+
+    print(f"workspace, {chat_count} chats, {n} messages")
+    print(f"  reparse every chat + views {reparse_time:8.3f}s")
+    print(f"  add every chat             {add_time:8.3f}s")
+    print(f"  add them again (unchanged) {readd_time:8.3f}s")
+    print(f"  open index + every view    {open_time:8.3f}s")
+    print(f"  every view, index loaded   {view_time:8.3f}s")
+
+
+# Peak RSS above a bare interpreter that streaming a compressed export may
+# reach, whatever the export's size: one read chunk and one message batch.
+STREAMING_CEILING_MIB = 64
+
+
+
+def write_archive(kind, data, path):
+    if kind == 'zip':
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('_chat.txt', data)
+        return
+    compress = gzip.compress if kind == 'gz' else zstandard.ZstdCompressor().compress
+    with open(path, 'wb') as file:
+        file.write(compress(data))
+
+
+WHOLE_BUFFER_READS = {
+    'gz': "gzip.decompress(data)",
+    'zip': "zipfile.ZipFile(io.BytesIO(data)).read('_chat.txt')",
+    'zst': "zstandard.ZstdDecompressor().decompress(data)",
+}
+
+STREAM_EXPORT = """
+import hashlib
+import preprocessor
+digest = hashlib.sha256()
+batches, _ = preprocessor.read_export(open(path, 'rb'))
+for batch in batches:
+    for date, message in zip(batch['message_date'], batch['user_message']):
+        digest.update((date + message).encode('utf-8'))
+print(digest.hexdigest())
+"""
+
+
+def stream_digest(path):
+    code = f"path = {path!r}\n" + STREAM_EXPORT
+    here = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run([sys.executable, '-c', code], cwd=here, check=True, capture_output=True, text=True)
+    return result.stdout.split()[0]
+
+
+# The same chat as plain text and in every archive format, side by side.
+BATCH_INPUTS = {'family.txt': None, 'family.txt.gz': 'gz', 'family.zip': 'zip', 'family.txt.zst': 'zst'}
+BATCH_MESSAGES = 2_000
+
+
+def batch_archives(scratch_dir):
+    # batch.py must give each input its own output directory; two workers
+    # writing to one would silently overwrite each other.
+    input_dir = os.path.join(scratch_dir, 'batch-in')
+    output_dir = os.path.join(scratch_dir, 'batch-out')
+    os.makedirs(input_dir)
+    data = synthetic.generate(messages=BATCH_MESSAGES).encode('utf-8')
+    for name, kind in BATCH_INPUTS.items():
+        if kind is None:
+            with open(os.path.join(input_dir, name), 'wb') as file:
+                file.write(data)
+        else:
+            write_archive(kind, data, os.path.join(input_dir, name))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert batch.run(input_dir, output_dir, workers=2) == 0
+
+    out_dirs = [batch.chat_output_dir(output_dir, name) for name in BATCH_INPUTS]
+    assert len(set(out_dirs)) == len(BATCH_INPUTS)
+    for out_dir in out_dirs:
+        with open(os.path.join(out_dir, 'metrics.json'), encoding='utf-8') as file:
+            assert json.load(file)['messages'] == BATCH_MESSAGES, out_dir
+    return [os.path.relpath(out_dir, output_dir) for out_dir in out_dirs]
+
+
+def bench_archives(n):
+    # Each archive is parsed in a fresh interpreter, both streamed and the old
+    # way: the whole upload in memory, decompressed, then decoded.
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        path = os.path.join(scratch_dir, 'chat.txt')
+        synthetic.write_export(path, messages=n)
+        with open(path, 'rb') as file:
+            data = file.read()
+        text_mib = len(data) / 2 ** 20
+        expected = stream_digest(path)
+
+        bare = peak_rss_mib("import preprocessor\n", calls='')
+        results = {}
+        for kind in WHOLE_BUFFER_READS:
+            archive_path = os.path.join(scratch_dir, 'chat.' + kind)
+            write_archive(kind, data, archive_path)
+            assert stream_digest(archive_path) == expected, kind
+
+            setup = f"import preprocessor\npath = {archive_path!r}\n"
+            started = time.perf_counter()
+            streamed = peak_rss_mib(setup, STREAM_EXPORT)
+            stream_time = time.perf_counter() - started
+            whole = peak_rss_mib(setup + "import gzip, io, zipfile, zstandard\n",
+                                 f"data = open(path, 'rb').read()\ntext = {WHOLE_BUFFER_READS[kind]}.decode('utf-8')\n")
+            assert streamed - bare < STREAMING_CEILING_MIB, (kind, streamed, bare)
+            results[kind] = (os.path.getsize(archive_path) / 2 ** 20, stream_time, streamed, whole)
+        del data
+        batch_outputs = batch_archives(scratch_dir)
+
+    print(f"compressed exports, {n} messages, {text_mib:.1f} MiB of text, bare interpreter {bare:.1f} MiB")
+    for kind, (size, stream_time, streamed, whole) in results.items():
+        print(f"  .{kind:4s} {size:7.1f} MiB  streamed read {stream_time:7.3f}s {streamed:8.1f} MiB peak"
+              f"   whole buffer {whole:8.1f} MiB peak")
+    print(f"  batch.py outputs for one chat in every format: {', '.join(batch_outputs)}")
+
+
+BENCHMARKS = {
+    'author_split': bench_author_split,
+    'formats': bench_formats,
+    'memory': bench_memory,
+    'calendar': bench_calendar,
+    'emoji': bench_emoji,
+    'links': bench_links,
+    'incremental': bench_incremental,
+    'cube': bench_cube,
+    'segmentation': bench_segmentation,
+    'smoothing': bench_smoothing,
+    'time_of_day': bench_time_of_day,
+    'word_cloud': bench_word_cloud,
+    'out_of_core': bench_out_of_core,
+    'workspace': bench_workspace,
+    'archives': bench_archives,
+    'imports': bench_imports,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Ingestion and analysis benchmarks")
+    parser.add_argument('benchmarks', nargs='*', help=f"any of: {', '.join(BENCHMARKS)} (default: all)")
+    parser.add_argument('-n', '--messages', type=int, default=200_000)
+    args = parser.parse_args()
+
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmark: {', '.join(sorted(unknown))}")
+
+    for name in args.benchmarks or BENCHMARKS:
+        BENCHMARKS[name](args.messages)
@@ -0,0 +1,205 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import cache
+import context
+import helper
+import links
+import preprocessor
+import sentiment
+import synthetic
+import word_cloud
+
+SIZES = {'10k': 10_000, '100k': 100_000, '1M': 1_000_000, '5M': 5_000_000}
+
+HISTORY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_history.jsonl')
+DATA_DIR = os.path.join(cache.CACHE_DIR, 'synthetic')
+
+# A stage regresses when it is this much slower than the median of the last
+# BASELINE_RUNS runs on the same machine, and by more than MIN_SECONDS.
+REGRESSION_THRESHOLD = 0.25
+MIN_SECONDS = 0.05
+BASELINE_RUNS = 5
+
+HELPER_CALLS = {
+    'fetch_stats': lambda df: helper.fetch_stats('Everyone', df),
+    'most_busy_users': lambda df: helper.most_busy_users('Everyone', df),
+    'create_word_cloud': lambda df: helper.create_word_cloud(df),
+    'most_common_words': lambda df: helper.most_common_words('Everyone', df),
+    'identify_conversation_starters': lambda df: helper.identify_conversation_starters('Everyone', df),
+    'emoji_helper': lambda df: helper.emoji_helper('Everyone', df),
+    'monthly_timeline': lambda df: helper.monthly_timeline('Everyone', df),
+    'daily_timeline': lambda df: helper.daily_timeline('Everyone', df),
+    'week_activity_map': lambda df: helper.week_activity_map('Everyone', df),
+    'month_activity_map': lambda df: helper.month_activity_map('Everyone', df),
+    'activity_heatmap': lambda df: helper.activity_heatmap('Everyone', df),
+    'calculate_response_times': lambda df: helper.calculate_response_times('Everyone', df),
+    'calculate_silent_periods': lambda df: helper.calculate_silent_periods('Everyone', df),
+    'get_most_active_user': lambda df: helper.get_most_active_user(df),
+    'smoothed_daily_activity': lambda df: helper.smoothed_daily_activity('Everyone', df),
+    'activity_time_of_day_ts': lambda df: helper.activity_time_of_day_ts('Everyone', df),
+    'activity_day_of_week_ts': lambda df: helper.activity_day_of_week_ts(df, 'Everyone'),
+    'sentiment_analysis': lambda df: helper.sentiment_analysis(df, 'Everyone'),
+    'find_longest_consecutive_streak': lambda df: helper.find_longest_consecutive_streak(df, 'Everyone'),
+    'analyze_response_time': lambda df: helper.analyze_response_time(df, 'Everyone'),
+    'plot_most_talkative_day': lambda df: helper.plot_most_talkative_day(df),
+    'assign_chat_badges': lambda df: helper.assign_chat_badges(df),
+}
+
+
+def export_path(messages, data_dir=DATA_DIR, seed=0):
+    # Generated once per size and seed, then reused by later runs.
+    path = os.path.join(data_dir, f'chat-{messages}-{seed}.txt')
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        tmp_path = path + '.tmp'
+        synthetic.write_export(tmp_path, messages=messages, seed=seed)
+        os.replace(tmp_path, path)
+    return path
+
+
+def _cold_start(scratch_dir):
+    # Each helper is timed as if it ran first: no shared analysis context, no
+    # cached URL lookups, an empty sentiment score cache and no rendered word
+    # clouds.
+    context._contexts.clear()
+    links.find_urls.cache_clear()
+    sentiment.SENTIMENT_DB = os.path.join(scratch_dir, f'sentiment-{time.perf_counter_ns()}.sqlite')
+    word_cloud.WORD_CLOUD_DIR = os.path.join(scratch_dir, f'wordclouds-{time.perf_counter_ns()}')
+
+
+def run_size(messages, data_dir=DATA_DIR, repeat=1):
+    path = export_path(messages, data_dir)
+    stages = {}
+    errors = {}
+
+    def measure(name, fn, *args):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            try:
+                result = fn(*args)
+            except Exception as e:
+                errors[name] = f'{type(e).__name__}: {e}'[:200]
+                return None
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        stages[name] = best
+        return result
+
+    def parse():
+        with open(path, 'rb') as file:
+            return preprocessor.preprocess(file)[0]
+
+    df = measure('preprocess', parse)
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        for name, call in HELPER_CALLS.items():
+            _cold_start(scratch_dir)
+            measure(name, call, df)
+        context._contexts.clear()
+
+    return stages, errors
+
+
+def _commit():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path=HISTORY_PATH):
+    history = []
+    try:
+        with open(path, encoding='utf-8') as file:
+            for line in file:
+                if line.strip():
+                    history.append(json.loads(line))
+    except OSError:
+        pass
+    return history
+
+
+def append_history(record, path=HISTORY_PATH):
+    with open(path, 'a', encoding='utf-8') as file:
+        file.write(json.dumps(record) + '\n')
+
+
+def baseline(history, record, stage):
+    previous = [entry['stages'][stage] for entry in history
+                if entry['size'] == record['size'] and entry['host'] == record['host']
+                and entry['stages'].get(stage) is not None]
+    previous = previous[-BASELINE_RUNS:]
+    return statistics.median(previous) if previous else None
+
+
+def regressions(history, record):
+    found = {}
+    for stage, seconds in record['stages'].items():
+        reference = baseline(history, record, stage)
+        if reference is None:
+            continue
+        if seconds > reference * (1 + REGRESSION_THRESHOLD) and seconds - reference > MIN_SECONDS:
+            found[stage] = (seconds, reference)
+    return found
+
+
+def report(record, history):
+    flagged = regressions(history, record)
+    print(f"{record['size']} messages")
+    for stage, seconds in record['stages'].items():
+        reference = baseline(history, record, stage)
+        change = f"{(seconds / reference - 1) * 100:+7.1f}%" if reference else '        '
+        flag = '  REGRESSION' if stage in flagged else ''
+        rate = record['messages'] / seconds if seconds else 0
+        print(f"  {stage:34s} {seconds:9.3f}s {rate:14,.0f} msg/s {change}{flag}")
+    for stage, error in record['errors'].items():
+        print(f"  {stage:34s} failed: {error}")
+    return flagged
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time preprocess and every helper on synthetic exports")
+    parser.add_argument('sizes', nargs='*', help=f"any of: {', '.join(SIZES)} (default: all)")
+    parser.add_argument('--repeat', type=int, default=1, help="best of this many runs per stage")
+    parser.add_argument('--history', default=HISTORY_PATH, help="JSON lines file results are appended to")
+    parser.add_argument('--data-dir', default=DATA_DIR, help="where generated exports are kept")
+    parser.add_argument('--no-record', action='store_true', help="compare against history without appending")
+    args = parser.parse_args()
+
+    unknown = set(args.sizes) - set(SIZES)
+    if unknown:
+        parser.error(f"unknown size: {', '.join(sorted(unknown))}")
+
+    history = load_history(args.history)
+    commit = _commit()
+    failed = False
+    for size in args.sizes or SIZES:
+        stages, errors = run_size(SIZES[size], args.data_dir, args.repeat)
+        record = {
+            'time': datetime.datetime.now().isoformat(timespec='seconds'),
+            'commit': commit,
+            'host': platform.node(),
+            'python': platform.python_version(),
+            'size': size,
+            'messages': SIZES[size],
+            'stages': stages,
+            'errors': errors,
+        }
+        flagged = report(record, history)
+        # A stage that crashed fails the run like a regression does.
+        failed |= bool(flagged or errors)
+        if not args.no_record:
+            append_history(record, args.history)
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import shutil
+
+import preprocessor
+
+CACHE_DIR = os.environ.get('CHAT_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'whatsapp-chat-analysis'))
+CACHE_MAX_BYTES = int(os.environ.get('CHAT_CACHE_MAX_BYTES', 1 << 30))
+
+# Bump when the shape of the parsed frame changes so stale entries are ignored.
+CACHE_VERSION = 1
+
+# Subdirectories holding one entry per directory (a chat store, a dataset or
+# DuckDB's spill directory); everything else in the cache is evicted file by
+# file.
+ENTRY_DIRS = ('chats', 'datasets')
+# Not a cache: never evicted or counted.
+KEEP_DIRS = ('workspace',)
+
+
+def content_hash(source, chunk_size=preprocessor.CHUNK_SIZE):
+    digest = hashlib.sha256()
+
+    if isinstance(source, str):
+        for start in range(0, len(source), chunk_size):
+            digest.update(source[start:start + chunk_size].encode('utf-8'))
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        digest.update(source)
+    else:
+        source.seek(0)
+        for chunk in iter(lambda: source.read(chunk_size), b''):
+            digest.update(chunk)
+        source.seek(0)
+
+    return digest.hexdigest()
+
+
+def cache_key(source, **options):
+    settings = json.dumps({'version': CACHE_VERSION, **options}, sort_keys=True)
+    return content_hash(source) + '-' + hashlib.sha256(settings.encode('utf-8')).hexdigest()[:16]
+
+
+def _date_range(df):
+    start_date = df['date'].min() if not df.empty else None
+    last_date = df['date'].max() if not df.empty else None
+    return start_date, last_date
+
+
+def load_meta(directory):
+    # The meta.json of a chat store or dataset, or None when it is missing.
+    try:
+        with open(os.path.join(directory, 'meta.json'), encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _file_entry(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime, stat.st_size, path
+
+
+def _dir_entry(path):
+    # A directory is as recent as its newest file.
+    mtime = size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            entry = _file_entry(os.path.join(root, name))
+            if entry is not None:
+                mtime = max(mtime, entry[0])
+                size += entry[1]
+    return mtime, size, path
+
+
+def cache_entries(directory=CACHE_DIR):
+    entries = []
+    for root, dirs, files in os.walk(directory):
+        relative = os.path.relpath(root, directory)
+        if relative == '.':
+            dirs[:] = [name for name in dirs if name not in KEEP_DIRS]
+        elif relative in ENTRY_DIRS:
+            for name in dirs:
+                entry = _dir_entry(os.path.join(root, name))
+                # An empty one (an idle spill directory) frees nothing.
+                if entry[1]:
+                    entries.append(entry)
+            dirs.clear()
+        entries.extend(filter(None, (_file_entry(os.path.join(root, name)) for name in files)))
+    return entries
+
+
+def evict(max_bytes=CACHE_MAX_BYTES):
+    # Least recently used first, over the whole cache tree. The newest entry
+    # is the one just written and is always kept.
+    entries = sorted(cache_entries())
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries[:-1]:
+        if total <= max_bytes:
+            break
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+        total -= size
@@ -0,0 +1,336 @@
+import functools
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+import pandas as pd
+
+import cache
+import cube
+import links
+import preprocessor
+import word_index
+from profiling import profiled
+
+# Out-of-core backend: a parsed chat is written once as Parquet, one directory
+# per year, and the helpers that support it run as DuckDB queries over those
+# files instead of over an in-memory frame.
+DATASETS_DIR = os.path.join(cache.CACHE_DIR, 'datasets')
+
+# Bump when the stored columns change; older datasets are rewritten.
+DATASET_VERSION = 1
+
+# DuckDB's working memory; bigger sorts and windows spill to disk.
+MEMORY_LIMIT = os.environ.get('CHAT_DUCKDB_MEMORY', '512MB')
+
+# Rows per batch when messages are streamed back through Python.
+SCAN_BATCH_SIZE = 100_000
+
+MEDIA_MESSAGE = word_index.MEDIA_PLACEHOLDER + '\n'
+
+# Chronological order with export order breaking ties, as segmentation sorts.
+CHRONOLOGICAL = 'ORDER BY date NULLS LAST, seq'
+
+_connection = None
+
+
+def _get_connection():
+    global _connection
+    if _connection is None:
+        import duckdb
+        _connection = duckdb.connect()
+        _connection.execute(f"SET memory_limit = '{MEMORY_LIMIT}'")
+        _connection.execute(f"SET temp_directory = '{_quote(os.path.join(DATASETS_DIR, '.spill'))}'")
+        # Spilled data counts against the cache budget like everything else.
+        _connection.execute(f"SET max_temp_directory_size = '{cache.CACHE_MAX_BYTES}B'")
+    return _connection
+
+
+def _quote(text):
+    return text.replace("'", "''")
+
+
+class ChatDataset:
+    # Stands in for the message frame: helpers wrapped with dispatch() answer
+    # from queries, and the analysis context builds its cube from one.
+
+    def __init__(self, path):
+        self.path = path
+        self.meta = cache.load_meta(path)
+
+    def __len__(self):
+        return self.meta['message_count']
+
+    @property
+    def users(self):
+        return list(self.meta['users'])
+
+    def date_range(self):
+        return pd.Timestamp(self.meta['start_date']), pd.Timestamp(self.meta['last_date'])
+
+    def _sql(self, sql, **parts):
+        source = f"read_parquet('{_quote(os.path.join(self.path, '*', '*.parquet'))}')"
+        return sql.format(messages=source, **parts)
+
+    def touch(self):
+        # Marks the dataset as recently used for cache eviction.
+        try:
+            os.utime(os.path.join(self.path, 'meta.json'))
+        except OSError:
+            pass
+
+    def query(self, sql, params=(), **parts):
+        # A cursor per query, so concurrent sessions do not share one.
+        self.touch()
+        return _get_connection().cursor().execute(self._sql(sql, **parts), list(params)).df()
+
+    def scan(self, sql, params=(), batch_size=SCAN_BATCH_SIZE, **parts):
+        self.touch()
+        cursor = _get_connection().cursor()
+        reader = cursor.execute(self._sql(sql, **parts), list(params)).fetch_record_batch(batch_size)
+        for batch in reader:
+            yield batch.to_pandas()
+
+
+def _write_part(directory, year, number, frame):
+    part_dir = os.path.join(directory, f'year={year}')
+    os.makedirs(part_dir, exist_ok=True)
+    frame.to_parquet(os.path.join(part_dir, f'part-{number:05d}.parquet'), index=False)
+
+
+@profiled(name='columnar.write_dataset')
+def write_dataset(source, directory, chat_format=None):
+    # Parses the export batch by batch, so memory stays at one batch however
+    # long the chat is. seq is the message's position in the export, which is
+    # also its row label in the frame preprocess() would build.
+    batches, chat_format = preprocessor.read_export(source, chat_format)
+
+    tmp_dir = f'{directory}.{uuid.uuid4().hex}.tmp'
+    count = 0
+    users = set()
+    start_date = last_date = None
+    for number, frame in enumerate(preprocessor.iter_frames(batches, chat_format)):
+        frame.insert(0, 'seq', np.arange(count, count + len(frame), dtype='int64'))
+        frame['date'] = frame['date'].astype('datetime64[us]')
+        count += len(frame)
+        users.update(frame['user'].unique())
+
+        dates = frame['date'].dropna()
+        if not dates.empty:
+            start_date = dates.min() if start_date is None else min(start_date, dates.min())
+            last_date = dates.max() if last_date is None else max(last_date, dates.max())
+
+        years = frame['date'].dt.year.fillna(-1).astype(int)
+        for year, part in frame.groupby(years):
+            _write_part(tmp_dir, 'unknown' if year < 0 else year, number, part)
+
+    if count == 0:
+        # DuckDB needs at least one file to know the columns.
+        empty = preprocessor._empty_frame()
+        empty.insert(0, 'seq', pd.Series(dtype='int64'))
+        _write_part(tmp_dir, 'unknown', 0, empty.astype({'date': 'datetime64[us]'}))
+
+    meta = {
+        'version': DATASET_VERSION,
+        'chat_format': chat_format,
+        'message_count': count,
+        'users': sorted(users),
+        'start_date': None if start_date is None else start_date.isoformat(),
+        'last_date': None if last_date is None else last_date.isoformat(),
+    }
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as file:
+        json.dump(meta, file)
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp_dir, directory)
+    return ChatDataset(directory)
+
+
+def open_dataset(source, key=None, chat_format=None):
+    # key is cache.cache_key(source) when the caller already has it.
+    key = key or cache.cache_key(source)
+    directory = os.path.join(DATASETS_DIR, key)
+    meta = cache.load_meta(directory)
+    if meta is None or meta['version'] != DATASET_VERSION:
+        dataset = write_dataset(source, directory, chat_format)
+        cache.evict()
+        return dataset
+    dataset = ChatDataset(directory)
+    dataset.touch()
+    return dataset
+
+
+def dispatch(fn):
+    # For helpers with an out-of-core version: a call with a ChatDataset in
+    # place of the frame goes to the function of the same name in this module.
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if any(isinstance(value, ChatDataset) for value in (*args, *kwargs.values())):
+            return globals()[fn.__name__](*args, **kwargs)
+        return fn(*args, **kwargs)
+
+    return wrapper
+
+
+def _where(selected_user, members=False):
+    conditions = []
+    params = []
+    if selected_user != 'Everyone':
+        conditions.append('"user" = ?')
+        params.append(selected_user)
+    if members:
+        conditions.append("\"user\" <> 'group_notification'")
+    return ('WHERE ' + ' AND '.join(conditions)) if conditions else '', params
+
+
+@profiled(name='columnar.build_cube')
+def build_cube(dataset):
+    chat_cube = dataset.query('''
+        SELECT "user", date_trunc('day', date) AS date, hour(date) AS hour,
+               count(*) AS messages, sum(msg_length) AS msg_length
+        FROM {messages}
+        WHERE date IS NOT NULL
+        GROUP BY ALL
+        ORDER BY "user", date, hour
+    ''')
+    chat_cube['date'] = chat_cube['date'].astype('datetime64[ns]')
+    return cube.compact(chat_cube)
+
+
+@functools.lru_cache(maxsize=64)
+@profiled(name='columnar.fetch_stats')
+def fetch_stats(selected_user, dataset):
+    # Words and links need the Python tokenizers, so messages are streamed
+    # through them a batch at a time. The dashboard asks on every rerun, hence
+    # the cache.
+    where, params = _where(selected_user)
+    num_messages = num_words = num_media_messages = num_links = 0
+    for batch in dataset.scan('SELECT message FROM {messages} {where}', params, where=where):
+        messages = batch['message']
+        num_messages += len(messages)
+        num_words += int(word_index.word_counts(messages).sum())
+        num_media_messages += int((messages == MEDIA_MESSAGE).sum())
+        num_links += len(links.extract(messages))
+    return num_messages, num_words, num_media_messages, num_links
+
+
+@profiled(name='columnar.user_message_counts')
+def user_message_counts(selected_user, dataset):
+    where, params = _where(selected_user, members=True)
+    counts = dataset.query('''
+        SELECT "user", count(*) AS count
+        FROM {messages} {where}
+        GROUP BY "user"
+        ORDER BY count DESC, min(seq)
+    ''', params, where=where)
+    return pd.Series(counts['count'].to_numpy(), index=pd.Index(counts['user'], name='user'), name='count')
+
+
+@profiled(name='columnar.most_busy_users')
+def most_busy_users(selected_user, dataset):
+    counts = user_message_counts(selected_user, dataset)
+    x = counts.head()
+    df = round((counts / counts.sum()) * 100, 2).reset_index().rename(
+        columns={'index': 'name', 'user': 'percent'})
+    return x, df
+
+
+@functools.lru_cache(maxsize=64)
+@profiled(name='columnar.get_most_active_user')
+def get_most_active_user(dataset):
+    most_active = dataset.query('''
+        SELECT "user" FROM {messages} GROUP BY "user" ORDER BY count(*) DESC, "user" LIMIT 1
+    ''')
+    if most_active.empty:
+        return "No active user"
+    return most_active['user'].iloc[0]
+
+
+@profiled(name='columnar.identify_conversation_starters')
+def identify_conversation_starters(selected_user, dataset, gap_minutes=30):
+    where, params = _where(selected_user, members=True)
+    return dataset.query('''
+        WITH ordered AS (
+            SELECT "user", row_number() OVER w AS position,
+                   (epoch_us(date) - epoch_us(lag(date) OVER w)) / 1e6 AS gap
+            FROM {messages} {where}
+            WINDOW w AS ({order})
+        )
+        SELECT "user" AS "User", count(*) AS "Conversation Starts"
+        FROM ordered
+        WHERE gap / 60 > ?
+        GROUP BY "user"
+        ORDER BY "Conversation Starts" DESC, min(position)
+    ''', [*params, gap_minutes], where=where, order=CHRONOLOGICAL)
+
+
+@profiled(name='columnar.find_longest_consecutive_streak')
+def find_longest_consecutive_streak(dataset, selected_user):
+    where, params = _where(selected_user)
+    # Ties go to the alphabetically first user, then to their earliest streak.
+    longest = dataset.query('''
+        WITH ordered AS (
+            SELECT "user", row_number() OVER w AS position,
+                   "user" IS DISTINCT FROM lag("user") OVER w AS changed
+            FROM {messages} {where}
+            WINDOW w AS ({order})
+        ),
+        runs AS (
+            SELECT *, sum(changed::INTEGER) OVER (ORDER BY position) AS run_id FROM ordered
+        )
+        SELECT any_value("user") AS "user", count(*) AS streak_length,
+               min(position) AS first_position, max(position) AS last_position
+        FROM runs
+        GROUP BY run_id
+        ORDER BY streak_length DESC, "user", run_id
+        LIMIT 1
+    ''', params, where=where, order=CHRONOLOGICAL)
+
+    if longest.empty:
+        return None
+    longest = longest.iloc[0]
+
+    # Positions are numbered over the narrow columns only; messages are read
+    # for the streak's rows alone.
+    streak_data = dataset.query('''
+        WITH ordered AS (
+            SELECT seq, row_number() OVER ({order}) AS position FROM {messages} {where}
+        )
+        SELECT seq, date, "user", message
+        FROM {messages} JOIN ordered USING (seq)
+        WHERE position BETWEEN ? AND ?
+        ORDER BY position
+    ''', [*params, int(longest['first_position']), int(longest['last_position'])], where=where,
+        order=CHRONOLOGICAL)
+    streak_data = streak_data.set_index('seq').rename_axis(None)
+    streak_data['date'] = streak_data['date'].astype('datetime64[ns]')
+
+    return {
+        'user': longest['user'],
+        'streak_length': np.int64(longest['streak_length']),
+        'start_time': streak_data['date'].min(),
+        'end_time': streak_data['date'].max(),
+        'streak_messages': streak_data[['date', 'user', 'message']]
+    }
+
+
+@profiled(name='columnar.median_response_times')
+def median_response_times(selected_user, dataset):
+    where, params = _where(selected_user, members=True)
+    # Quick follow-ups by the same author are not responses.
+    return dataset.query('''
+        WITH ordered AS (
+            SELECT "user",
+                   (epoch_us(date) - epoch_us(lag(date) OVER w)) / 1e6 AS gap,
+                   "user" = lag("user") OVER w AS same_author
+            FROM {messages} {where}
+            WINDOW w AS ({order})
+        )
+        SELECT "user", median(gap / 60) AS response_time
+        FROM ordered
+        WHERE NOT coalesce(gap < 180 AND same_author, false)
+        GROUP BY "user"
+        ORDER BY "user"
+    ''', params, where=where, order=CHRONOLOGICAL)
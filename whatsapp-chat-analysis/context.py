@@ -0,0 +1,153 @@
+from collections import OrderedDict
+from functools import cached_property
+
+import pandas as pd
+
+import columnar
+import cube
+import emoji_engine
+import links
+import segmentation
+import sentiment
+import word_index
+
+MEDIA_MESSAGE = '<Media omitted>\n'
+
+# Contexts for the most recently analysed chat frames, one per selected user.
+# Each entry keeps its frame alive so the id() key cannot be reused.
+MAX_CHATS = 4
+_contexts = OrderedDict()
+
+
+class AnalysisContext:
+    # Filtered views and per-message scans shared by every helper for one
+    # (chat, selected_user) pair. Everything is computed on first use. Per-message
+    # data is built once on the 'Everyone' context and sliced for single users.
+
+    def __init__(self, chat, selected_user='Everyone'):
+        self.chat = chat
+        self.selected_user = selected_user
+        self.parent = None if selected_user == 'Everyone' else analysis_context('Everyone', chat)
+        self._segments = {}
+
+    def _frame(self):
+        if isinstance(self.chat, columnar.ChatDataset):
+            raise NotImplementedError("this analysis needs the in-memory frame; it has no out-of-core version")
+        return self.chat
+
+    def _for_user(self, name, build):
+        if self.parent is None:
+            return build(self._frame())
+        return getattr(self.parent, name)[self.user_mask]
+
+    def _for_user_rows(self, name, build):
+        # Like _for_user, for series with one row per occurrence (emoji, URLs)
+        # indexed by the message they came from.
+        if self.parent is None:
+            return build(self._frame())
+        found = getattr(self.parent, name)
+        return found[self.user_mask.loc[found.index].to_numpy()]
+
+    @cached_property
+    def user_mask(self):
+        if self.parent is None:
+            return pd.Series(True, index=self._frame().index)
+        return self._frame()['user'] == self.selected_user
+
+    @cached_property
+    def cube(self):
+        if self.parent is None:
+            if isinstance(self.chat, columnar.ChatDataset):
+                return columnar.build_cube(self.chat)
+            return cube.build(self.chat)
+        chat_cube = self.parent.cube
+        return chat_cube[chat_cube['user'] == self.selected_user]
+
+    @cached_property
+    def notification_mask(self):
+        return self._for_user('notification_mask', lambda chat: chat['user'] == 'group_notification')
+
+    @cached_property
+    def media_mask(self):
+        return self._for_user('media_mask', lambda chat: chat['message'] == MEDIA_MESSAGE)
+
+    @cached_property
+    def df(self):
+        return self._frame() if self.parent is None else self._frame()[self.user_mask]
+
+    @cached_property
+    def members(self):
+        # The selected rows without group notifications.
+        return self.df[~self.notification_mask]
+
+    @cached_property
+    def chat_members(self):
+        # Every member's messages, whoever is selected.
+        if self.parent is not None:
+            return self.parent.chat_members
+        return self._frame()[~self.notification_mask]
+
+    @cached_property
+    def word_counts(self):
+        return self._for_user('word_counts', lambda chat: word_index.word_counts(chat['message']))
+
+    @cached_property
+    def term_frequencies(self):
+        # Per-(user, word) counts for the whole chat, built once and shared.
+        if self.parent is not None:
+            return self.parent.term_frequencies
+        members = self.chat_members
+        return word_index.term_frequencies(members['message'], members['user'], word_index.load_stopwords())
+
+    @cached_property
+    def word_frequencies(self):
+        users = None if self.parent is None else [self.selected_user]
+        return word_index.frequencies(self.term_frequencies, users)
+
+    @cached_property
+    def emojis(self):
+        return self._for_user_rows('emojis', lambda chat: emoji_engine.extract(chat['message']))
+
+    @cached_property
+    def emoji_counts(self):
+        return self.emojis.groupby(level=0).size().reindex(self.df.index, fill_value=0)
+
+    @cached_property
+    def sentiment_scores(self):
+        return self._for_user('sentiment_scores', lambda chat: sentiment.score_messages(chat['message']))
+
+    @cached_property
+    def urls(self):
+        return self._for_user_rows('urls', lambda chat: links.extract(chat['message']))
+
+    @cached_property
+    def link_counts(self):
+        return links.counts_by_user(self.df['user'], self.urls)
+
+    def segments(self, gap_minutes=segmentation.DEFAULT_GAP_MINUTES, members=True):
+        # Segmentation of members (or of every selected row), one per gap.
+        key = (members, gap_minutes)
+        if key not in self._segments:
+            frame = self.members if members else self.df
+            self._segments[key] = segmentation.segment(frame['date'], frame['user'], gap_minutes)
+        return self._segments[key]
+
+
+def analysis_context(selected_user, df):
+    key = id(df)
+    if key not in _contexts:
+        _contexts[key] = (df, {})
+        if len(_contexts) > MAX_CHATS:
+            _contexts.popitem(last=False)
+    _contexts.move_to_end(key)
+
+    contexts = _contexts[key][1]
+    if selected_user not in contexts:
+        contexts[selected_user] = AnalysisContext(df, selected_user)
+    return contexts[selected_user]
+
+
+def attach_cube(df, chat_cube):
+    # Hands a cube built at ingest (or loaded from the cache) to the contexts
+    # for df, so it is not rebuilt from the message rows.
+    analysis_context('Everyone', df).cube = chat_cube
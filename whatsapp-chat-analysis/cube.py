@@ -0,0 +1,53 @@
+from preprocessor import DAY_NAMES, MONTH_NAMES
+from profiling import profiled
+
+# Message counts and summed msg_length per (user, date, hour): one row per hour
+# in which a user wrote anything. Every timeline and activity panel is a roll-up
+# of this table, so it is built once per chat and the message rows are not
+# scanned again.
+
+
+def compact(cube):
+    return cube.astype({'user': 'category', 'hour': 'int8', 'messages': 'int32', 'msg_length': 'int64'})
+
+
+@profiled(name='cube.build')
+def build(df):
+    dates = df['date']
+    keys = [df['user'].astype(object).rename('user'), dates.dt.normalize(), dates.dt.hour.rename('hour')]
+    cube = df.groupby(keys).agg(messages=('message', 'size'), msg_length=('msg_length', 'sum'))
+    return compact(cube.reset_index())
+
+
+def without_user(cube, user):
+    return cube[cube['user'] != user]
+
+
+def by_month(cube, value='messages'):
+    dates = cube['date']
+    return cube.groupby([dates.dt.year.rename('year'), dates.dt.month.rename('month_num')])[value].sum().astype('int64')
+
+
+def by_date(cube, value='messages'):
+    return cube.groupby('date')[value].sum().astype('int64')
+
+
+def by_weekday(cube, value='messages'):
+    return cube.groupby(cube['date'].dt.dayofweek.rename('day_of_week'))[value].sum().astype('int64')
+
+
+def by_weekday_hour(cube, value='messages'):
+    return cube.groupby([cube['date'].dt.dayofweek.rename('day_of_week'), 'hour'])[value].sum().astype('int64')
+
+
+def by_weekday_user(cube, value='messages'):
+    users = cube['user'].astype(object)
+    return cube.groupby([cube['date'].dt.dayofweek.rename('day_of_week'), users])[value].sum().astype('int64')
+
+
+def day_names(day_of_week):
+    return [DAY_NAMES[int(day)] for day in day_of_week]
+
+
+def month_names(month_num):
+    return [MONTH_NAMES[int(month) - 1] for month in month_num]
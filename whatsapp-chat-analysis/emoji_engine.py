@@ -0,0 +1,123 @@
+import functools
+import re
+
+import emoji
+import pandas as pd
+
+from profiling import profiled
+
+# A trie over every sequence in emoji.EMOJI_DATA, so ZWJ sequences, skin tones,
+# flags and keycaps are matched whole (longest match wins). The None key marks
+# the end of a complete sequence.
+EMOJI_TRIE = {}
+for _sequence in emoji.EMOJI_DATA:
+    _node = EMOJI_TRIE
+    for _char in _sequence:
+        _node = _node.setdefault(_char, {})
+    _node[None] = True
+
+# Every emoji sequence contains a non-ASCII character, and keycaps start with one
+# ASCII character, so only these runs ever need walking through the trie.
+CANDIDATE_PATTERN = re.compile(r'[#*0-9]?[^\x00-\x7f]+')
+
+
+def _run_spans(run):
+    if run in emoji.EMOJI_DATA:
+        return [(0, len(run))]
+
+    spans = []
+    i = 0
+    n = len(run)
+    while i < n:
+        node = EMOJI_TRIE.get(run[i])
+        j = i + 1
+        match = 0
+        while node is not None:
+            if None in node:
+                match = j
+            if j == n:
+                break
+            node = node.get(run[j])
+            j += 1
+
+        if match:
+            spans.append((i, match))
+            i = match
+        else:
+            i += 1
+    return spans
+
+
+# The same few runs ('😂😂', '👍🏽') make up most of a chat, so each distinct run
+# is walked through the trie once.
+@functools.lru_cache(maxsize=1 << 16)
+def _run_emojis(run):
+    return tuple(run[start:end] for start, end in _run_spans(run))
+
+
+ZWJ = '\u200d'
+VARIATION_SELECTORS = str.maketrans('', '', '\ufe0e\ufe0f')
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _stripped_run(run):
+    # Matches emoji.replace_emoji, which also drops a joiner straight after an
+    # emoji and every variation selector left outside one.
+    parts = []
+    last = 0
+    for start, end in _run_spans(run):
+        parts.append(run[last:start])
+        last = end
+        if run.startswith(ZWJ, end) and run[end - 1] in EMOJI_TRIE:
+            last += 1
+    parts.append(run[last:])
+    return ''.join(parts).translate(VARIATION_SELECTORS)
+
+
+def find_emojis(message):
+    found = []
+    for run in CANDIDATE_PATTERN.findall(message):
+        found.extend(_run_emojis(run))
+    return found
+
+
+def _strip_run(match):
+    return _stripped_run(match.group())
+
+
+def strip_emojis(message):
+    return CANDIDATE_PATTERN.sub(_strip_run, message)
+
+
+def _non_ascii(messages):
+    # str.isascii is a flag check, so pure-ASCII messages are skipped for free.
+    return messages[~messages.map(str.isascii).astype(bool)]
+
+
+@profiled(name='emoji_engine.extract')
+def extract(messages):
+    # One row per emoji occurrence, indexed by the message it came from.
+    labels = []
+    found = []
+    for label, message in zip(messages.index, messages):
+        if message.isascii():
+            continue
+        for run in CANDIDATE_PATTERN.findall(message):
+            emojis = _run_emojis(run)
+            if emojis:
+                labels.extend([label] * len(emojis))
+                found.extend(emojis)
+    return pd.Series(found, index=pd.Index(labels, dtype=messages.index.dtype), dtype=object)
+
+
+def strip(messages):
+    stripped = messages.astype(object)
+    candidates = _non_ascii(messages)
+    stripped.loc[candidates.index] = candidates.map(strip_emojis)
+    return stripped
+
+
+def counts_by_user(users, found):
+    # found is the output of extract(); users is the matching 'user' column.
+    counts = found.groupby(users.loc[found.index].to_numpy()).value_counts()
+    return counts.rename_axis(['user', 'emoji'])
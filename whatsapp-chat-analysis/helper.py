@@ -1,445 +1,460 @@
-import alt
-from nltk.corpus import stopwords
-from urlextract import URLExtract
-from wordcloud import WordCloud
-import pandas as pd
-from collections import Counter
-import emoji
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
-from scipy.ndimage import gaussian_filter
-import altair as alt
-import numpy as np
-import nltk
-nltk.download('stopwords')
-
-
-extract = URLExtract()
-
-
-def fetch_stats(selected_user, df):
-    if selected_user != 'Everyone':
-        df = df[df['user'] == selected_user]
-
-    num_messages = df.shape[0]
-
-    words = []
-    for message in df['message']:
-        words.extend(message.split())
-
-    num_media_messages = df[df['message'] == '<Media omitted>\n'].shape[0]
-
-    links = []
-    for message in df['message']:
-        links.extend(extract.find_urls(message))
-
-    return num_messages, len(words), num_media_messages, len(links)
-
-
-def most_busy_users(selected_user, df):
-    df = df[df['user'] != 'group_notification']
-
-    if selected_user != 'Everyone':
-        df = df[df['user'] == selected_user]
-
-    x = df['user'].value_counts().head()
-    df = round((df['user'].value_counts() / df.shape[0]) * 100, 2).reset_index().rename(
-        columns={'index': 'name', 'user': 'percent'})
-    return x, df
-
-
-def create_word_cloud(df: pd.DataFrame):
-   
-    df = df[df['user']!= 'null']
-    df = df[df['user']!= 'Null']
-    df = df[~df['message'].str.contains('<Media omitted>', na=False)]
-    df = df[df['user'] != 'group_notification']
-
-    def remove_emojis(text):
-        return emoji.replace_emoji(text, replace='')
-
-    df['message'] = df['message'].apply(remove_emojis)
-
-    all_words = ' '.join(df['message'].astype(str)).split()
-
-    word_freq = pd.Series(all_words).value_counts().reset_index()
-    word_freq.columns = ['word', 'frequency']
-
-    word_freq = word_freq.head(100)
-
-    wordcloud = WordCloud(width=800, height=400, background_color='white').generate_from_frequencies(
-        dict(zip(word_freq['word'], word_freq['frequency'])))
-
-    img = wordcloud.to_image()
-
-    return img
-
-
-
-
-
-def most_common_words(selected_user, df):
-
-    if selected_user != 'Everyone':
-        df = df[df['user'] == selected_user]
-
-    temp = df[df['user'] != 'group_notification']
-    temp = temp[temp['message'] != '<Media omitted>\n']
-
-    words = []
-
-    for message in temp['message']:
-        for word in message.lower().split():
-            words.append(word)
-
-    most_common_df = pd.DataFrame(Counter(words).most_common(20))
-    return most_common_df
-
-
-def identify_conversation_starters(selected_user,df, gap_minutes=30):
-    df = df[df['user'] != 'group_notification']
-
-    if selected_user != 'Everyone':
-        df = df[df['user'] == selected_user]
-
-    df['date'] = pd.to_datetime(df['date'])
-
-    df = df.sort_values(by='date')
-
-    df['time_diff'] = df['date'].diff().dt.total_seconds() / 60
-
-    df['conversation_start'] = df['time_diff'] > gap_minutes
-
-    conversation_starters = df[df['conversation_start']]['user']
-
-    starter_counts = conversation_starters.value_counts().reset_index()
-    starter_counts.columns = ['User', 'Conversation Starts']
-
-    return starter_counts
-
-
-def emoji_helper(selected_user, df):
-    if selected_user != 'Everyone':
-        df = df[df['user'] == selected_user]
-
-    emojis = []
-    for message in df['message']:
-        emojis.extend([c for c in message if c in emoji.EMOJI_DATA])
-
-    emoji_df = pd.DataFrame(Counter(emojis).most_common(len(Counter(emojis))))
-
-    return emoji_df
-
-
-def monthly_timeline(selected_user, df):
-    if selected_user != "Everyone":
-        df = df[df["user"] == selected_user]
-
-    timeline = df.groupby(["year", "month_num", "month"]).count()["message"].reset_index()
-
-    timeline["year"] = timeline["year"].astype(int)
-    timeline["month_num"] = timeline["month_num"].astype(int)
-    timeline["time"] = pd.to_datetime(timeline["year"].astype(str) + "-" + timeline["month_num"].astype(str), format="%Y-%m")
-
-    timeline = timeline.sort_values("time")
-
-    return timeline
-
-def daily_timeline(selected_user, df):
-    if selected_user != "Everyone":
-        df = df[df["user"] == selected_user]
-
-    messages_daily = df.groupby("only_date").count()["message"].reset_index()
-
-    messages_daily["only_date"] = pd.to_datetime(messages_daily["only_date"])
-
-    messages_daily = messages_daily.sort_values("only_date")
-
-    return messages_daily
-
-
-def week_activity_map(selected_user, df):
-    if selected_user != 'Everyone':
-        df = df[df['user'] == selected_user]
-
-    x = df["day_name"].value_counts()
-
-    df = round((df["day_name"].value_counts() / df.shape[0]) * 100, 2).reset_index().rename(
-        columns={"index": "weekday", "day_name": "day_name"}
-    )
-
-    return x, df
-
-
-
-
-def month_activity_map(selected_user, df):
-    if selected_user != 'Everyone':
-        df = df[df['user'] == selected_user]
-
-    return df['month'].value_counts()
-
-
-def activity_heatmap(selected_user, df):
-    if selected_user != 'Everyone':
-        df = df[df['user'] == selected_user]
-
-    user_heatmap = df.pivot_table(index="day_name", columns="period", values="message", aggfunc="count").fillna(0)
-
-    day_order = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-    user_heatmap = user_heatmap.reindex(day_order)
-
-    return user_heatmap
-
-
-def calculate_response_times(selected_user, df):
-    if selected_user != 'Everyone':
-        df = df[df['user'] == selected_user]
-
-    df['response_time'] = df['date'].diff().dt.total_seconds() / 60  # Convert difference to minutes
-    df['response_time'] = df['response_time'].where(df['response_time'] < 1440)
-    return df
-
-
-def calculate_silent_periods(selected_user, df):
-    if selected_user != 'Everyone':
-        df = df[df['user'] == selected_user]
-    df['gap_hours'] = df['date'].diff().dt.total_seconds() / 3600  # Convert gap to hours
-    silent_periods = df['gap_hours'][df['gap_hours'] > 1]  # Filter gaps > 1 hour
-    return silent_periods
-
-
-def get_most_active_user(df: pd.DataFrame):
-
-    if df.empty or 'user' not in df.columns or 'message' not in df.columns:
-        return "No active user"
-
-    message_counts = df.groupby("user")["message"].count().reset_index()
-
-    if message_counts.empty:
-        return "No active user"
-
-    most_active = message_counts.sort_values("message", ascending=False).iloc[0]
-
-    return most_active["user"]
-
-
-def smoothed_daily_activity( selected_user, df: pd.DataFrame, years: int = 3):
-    if selected_user != 'Everyone':
-        df = df[df['user'] == selected_user]
-
-    df["year"] = df["date"].dt.year
-    min_year = df.year.max() - years
-    daily_activity_df = df.loc[df["year"] > min_year].groupby(
-        ['user',
-         'date']).first().unstack(
-        level=0).resample('D').sum(numeric_only=True).msg_length.fillna(0)
-
-    smoothed_daily_activity_df = pd.DataFrame(
-        gaussian_filter(daily_activity_df,
-                        (6, 0)),
-        index=daily_activity_df.index,
-        columns=daily_activity_df.columns)
-    return smoothed_daily_activity_df
-
-
-def activity_time_of_day_ts(selected_user, df: pd.DataFrame):
-    if selected_user != 'Everyone':
-        df = df[df['user'] == selected_user]
-
-    if df.empty:
-        return None
-
-    a = df.groupby([df.date.dt.hour, df.date.dt.minute, 'user'])['msg_length'].sum().unstack(fill_value=0)
-
-    a = a.reindex(pd.MultiIndex.from_product([range(24), range(60)], names=['hour', 'minute']), fill_value=0)
-
-    a = a.interpolate(method="linear", axis=0)
-    a = pd.concat([a.tail(120), a, a.head(120)])
-
-    smoothed = pd.DataFrame(gaussian_filter(a.values, (3, 0)), index=a.index, columns=a.columns)
-
-    smoothed = smoothed.iloc[120:-120]
-
-    smoothed = smoothed.reset_index()
-    smoothed['time'] = pd.to_datetime(smoothed['hour'].astype(str) + ':' + smoothed['minute'].astype(str).str.zfill(2))
-
-    melted = smoothed.melt(id_vars=['hour', 'minute', 'time'], var_name='user', value_name='activity')
-
-    chart = alt.Chart(melted).mark_line(interpolate='monotone').encode(
-        x=alt.X('time:T', title='Time of Day', axis=alt.Axis(format='%H:%M')),
-        y=alt.Y('activity:Q', title='Activity'),
-        color=alt.Color('user:N', title='User')
-    ).properties(
-        width=800,
-        height=400
-    )
-
-    return chart
-
-
-def activity_day_of_week_ts(df: pd.DataFrame, selected_user):
-    df = df[df['user'] != 'group_notification']
-
-    if selected_user != 'Everyone':
-        df = df[df['user'] == selected_user]
-
-    if df.empty:
-        return None
-
-    days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-    o = df.groupby([df.date.dt.dayofweek, df.user])['msg_length'].sum().unstack(fill_value=0)
-    o.index = pd.CategoricalIndex(o.index.map(lambda x: days[int(x)]), categories=days, ordered=True)
-    o = o.sort_index()
-
-    o_normalized = o.div(o.sum(axis=0), axis=1)
-
-    o_normalized.index.name = 'day_of_week'
-
-    o_melted = o_normalized.reset_index().melt(id_vars='day_of_week', var_name='user', value_name='activity')
-
-    chart = alt.Chart(o_melted).mark_rect().encode(
-        x=alt.X('day_of_week:N', sort=days, title='Day of Week'),
-        y=alt.Y('user:N', title='Author'),
-        color=alt.Color('activity:Q', scale=alt.Scale(scheme='viridis'), title='Activity'),
-        tooltip=[
-            alt.Tooltip('day_of_week:N', title='Day'),
-            alt.Tooltip('user:N', title='Author'),
-            alt.Tooltip('activity:Q', title='Activity', format='.1%')
-        ]
-    ).properties(
-        width=600,
-        height=400
-    )
-
-    text = chart.mark_text(baseline='middle').encode(
-        text=alt.Text('activity:Q', format='.1%'),
-        color=alt.condition(
-            alt.datum.activity > 0.15,
-            alt.value('white'),
-            alt.value('black')
-        )
-    )
-
-    return chart + text
-
-
-def sentiment_analysis(df, selected_user):
-    if selected_user != 'Everyone':
-        df = df[df['user'] == selected_user]
-
-    if df.empty:
-        return None
-
-    analyzer = SentimentIntensityAnalyzer()
-    df["sentiment_score"] = df["message"].apply(lambda x: analyzer.polarity_scores(x)["compound"])
-    df["sentiment"] = df["sentiment_score"].apply(lambda x: "Positive" if x > 0.05 else "Negative" if x < -0.05 else "Neutral")
-
-    sentiment_counts = df["sentiment"].value_counts().reset_index()
-    sentiment_counts.columns = ["sentiment", "count"]
-
-    return sentiment_counts
-
-
-def find_longest_consecutive_streak(df: pd.DataFrame, selected_user):
-    if selected_user != 'Everyone':
-        df = df[df['user'] == selected_user]
-
-    if df.empty:
-        return None
-
-    df = df.sort_values('date')
-
-    df['author_change'] = (df['user'] != df['user'].shift()).cumsum()
-
-    grouped = df.groupby(['user', 'author_change'])
-
-    streak_info = grouped.size().reset_index(name='streak_length')
-    longest_streak = streak_info.loc[streak_info['streak_length'].idxmax()]
-
-    max_spammer = longest_streak['user']
-    max_spam = longest_streak['streak_length']
-
-    streak_data = grouped.get_group((max_spammer, longest_streak['author_change']))
-    start_time = streak_data['date'].min()
-    end_time = streak_data['date'].max()
-
-    streak_messages = streak_data[['date', 'user', 'message']]
-
-    return {
-        'user': max_spammer,
-        'streak_length': max_spam,
-        'start_time': start_time,
-        'end_time': end_time,
-        'streak_messages': streak_messages
-    }
-
-def analyze_response_time(df: pd.DataFrame, selected_user):
-    df = df[df['user'] != 'group_notification']
-
-    if selected_user != 'Everyone':
-        df = df[df['user'] == selected_user]
-
-    df = df.sort_values(["date", "user"])
-    df['time_diff'] = df['date'].diff().dt.total_seconds()
-    df['same_author'] = df['user'] == df['user'].shift()
-
-    response_data = df[~((df['time_diff'] < 180) & df['same_author'])]
-
-    response_data['response_time'] = response_data['time_diff'] / 60
-
-    response_data['log_response_time'] = np.log10(response_data['response_time'])
-
-    median_response_time = response_data.groupby('user')['response_time'].median().reset_index()
-
-
-    median_chart = alt.Chart(median_response_time).mark_bar().encode(
-        y=alt.Y('user:N', sort='-x'),
-        x=alt.X('response_time:Q', title='Median Response Time (minutes)'),
-        color='user:N'
-    )
-
-    return {
-        'median_chart': median_chart,
-        'slowest_responder': median_response_time.loc[median_response_time['response_time'].idxmax(), 'user']
-    }
-
-def plot_most_talkative_day(df):
-    df['date'] = pd.to_datetime(df['date'])
-
-    daily_message_counts = df.groupby(df['date'].dt.date)['message'].count()
-
-    most_talkative_day = daily_message_counts.idxmax()
-    highest_message_count = daily_message_counts.max()
-
-    return daily_message_counts, most_talkative_day, highest_message_count
-
-
-def assign_chat_badges(df):
-    badges = {}
-
-    df = df[df['user'] != 'group_notification']
-
-    def count_emojis(message):
-        return sum(1 for char in message if char in emoji.EMOJI_DATA)
-    df['emoji_count'] = df['message'].apply(count_emojis)
-    emoji_master = df.groupby('user')['emoji_count'].sum().idxmax()
-    badges[emoji_master] = "Emoji Master 🏆"
-
-    gif_messages = df[df['message'] == '<Media omitted>\n']
-    gif_guru = gif_messages['user'].value_counts().idxmax() if not gif_messages.empty else None
-    if gif_guru:
-        badges[gif_guru] = "GIF Guru 🎥"
-
-    df['hour'] = pd.to_datetime(df['date']).dt.hour
-    late_night_messages = df[(df['hour'] >= 0) & (df['hour'] < 6)]
-    late_night_texter = late_night_messages['user'].value_counts().idxmax() if not late_night_messages.empty else None
-    if late_night_texter:
-        badges[late_night_texter] = "Late Night Texter 🌙"
-
-    top_chatter = df['user'].value_counts().idxmax()
-    badges[top_chatter] = "Top Chatter 💬"
-
-    silent_observer = df['user'].value_counts().idxmin()
-    badges[silent_observer] = "Silent Observer 🤐"
-
-    return badges
+import pandas as pd
+from collections import Counter
+import sentiment
+import word_index
+import word_cloud
+import columnar
+import cube
+import segmentation
+import numpy as np
+from context import analysis_context
+from profiling import profiled
+from preprocessor import DAY_NAMES, PERIODS
+
+
+def value_counts(series):
+    # Most frequent first; ties keep the order the values first occur in, which
+    # is what the DuckDB queries sort by too. Categorical columns (compact
+    # frames) only report values that actually occur.
+    codes, uniques = pd.factorize(series)
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    order = np.argsort(-counts, kind='stable')
+    return pd.Series(counts[order], index=pd.Index(uniques[order], name=series.name), name='count')
+
+
+@profiled
+@columnar.dispatch
+def fetch_stats(selected_user, df):
+    ctx = analysis_context(selected_user, df)
+
+    num_messages = ctx.df.shape[0]
+    num_words = int(ctx.word_counts.sum())
+    num_media_messages = int(ctx.media_mask.sum())
+    num_links = len(ctx.urls)
+
+    return num_messages, num_words, num_media_messages, num_links
+
+
+@profiled
+@columnar.dispatch
+def user_message_counts(selected_user, df):
+    # Messages per member, busiest first.
+    return value_counts(analysis_context(selected_user, df).members['user'])
+
+
+@profiled
+@columnar.dispatch
+def most_busy_users(selected_user, df):
+    counts = user_message_counts(selected_user, df)
+
+    x = counts.head()
+    df = round((counts / counts.sum()) * 100, 2).reset_index().rename(
+        columns={'index': 'name', 'user': 'percent'})
+    return x, df
+
+
+@profiled
+def word_cloud_frequencies(selected_user, df, top_n=100):
+    # Drawn from the whole chat's word index, so per-user clouds reuse it.
+    table = analysis_context('Everyone', df).term_frequencies
+    if selected_user == 'Everyone':
+        users = [user for user in table.index.unique('user') if user not in ('null', 'Null')]
+    else:
+        users = [selected_user]
+
+    return word_index.frequencies(table, users).head(top_n)
+
+
+@profiled
+def create_word_cloud(df: pd.DataFrame, selected_user='Everyone', preview=False):
+    return word_cloud.render(word_cloud_frequencies(selected_user, df), preview=preview)
+
+
+@profiled
+def most_common_words(selected_user, df):
+    top_words = analysis_context(selected_user, df).word_frequencies.head(20)
+
+    most_common_df = pd.DataFrame({0: top_words.index, 1: top_words.to_numpy()})
+    return most_common_df
+
+
+@profiled
+@columnar.dispatch
+def identify_conversation_starters(selected_user,df, gap_minutes=30):
+    segments = analysis_context(selected_user, df).segments(gap_minutes)
+
+    starts = segments.gaps / 60 > gap_minutes
+
+    conversation_starters = pd.Series(segments.names[segments.users[starts]], name='user')
+
+    starter_counts = value_counts(conversation_starters).reset_index()
+    starter_counts.columns = ['User', 'Conversation Starts']
+
+    return starter_counts
+
+
+@profiled
+def emoji_helper(selected_user, df):
+    emojis = analysis_context(selected_user, df).emojis
+
+    emoji_df = pd.DataFrame(Counter(emojis).most_common(len(Counter(emojis))))
+
+    return emoji_df
+
+
+@profiled
+def monthly_timeline(selected_user, df):
+    counts = cube.by_month(analysis_context(selected_user, df).cube)
+
+    timeline = counts.rename("message").reset_index()
+
+    timeline["year"] = timeline["year"].astype(int)
+    timeline["month_num"] = timeline["month_num"].astype(int)
+    timeline.insert(2, "month", cube.month_names(timeline["month_num"]))
+    timeline["time"] = pd.to_datetime(timeline["year"].astype(str) + "-" + timeline["month_num"].astype(str), format="%Y-%m")
+
+    timeline = timeline.sort_values("time")
+
+    return timeline
+
+@profiled
+def daily_timeline(selected_user, df):
+    counts = cube.by_date(analysis_context(selected_user, df).cube)
+
+    messages_daily = counts.rename("message").rename_axis("only_date").reset_index()
+
+    return messages_daily
+
+
+@profiled
+def week_activity_map(selected_user, df):
+    counts = cube.by_weekday(analysis_context(selected_user, df).cube)
+
+    x = pd.Series(counts.to_numpy(), index=pd.Index(cube.day_names(counts.index), name="day_name"), name="count")
+    x = x.sort_values(ascending=False, kind="stable")
+
+    df = round((x / x.sum()) * 100, 2).reset_index().rename(
+        columns={"index": "weekday", "day_name": "day_name"}
+    )
+
+    return x, df
+
+
+
+
+@profiled
+def month_activity_map(selected_user, df):
+    counts = cube.by_month(analysis_context(selected_user, df).cube).groupby(level="month_num").sum()
+
+    months = pd.Series(counts.to_numpy(), index=pd.Index(cube.month_names(counts.index), name="month"), name="count")
+    return months.sort_values(ascending=False, kind="stable")
+
+
+@profiled
+def activity_heatmap(selected_user, df):
+    counts = cube.by_weekday_hour(analysis_context(selected_user, df).cube)
+
+    user_heatmap = counts.unstack().fillna(0)
+    user_heatmap = user_heatmap.reindex(range(7))
+
+    user_heatmap.index = pd.Index(DAY_NAMES, name='day_name')
+    user_heatmap.columns = pd.Index([PERIODS[int(hour)] for hour in user_heatmap.columns], name='period')
+
+    return user_heatmap
+
+
+@profiled
+def calculate_response_times(selected_user, df):
+    ctx = analysis_context(selected_user, df)
+    segments = ctx.segments(members=False)
+
+    response_time = pd.Series(segmentation.in_frame_order(segments, segments.gaps) / 60, index=ctx.df.index)  # Convert difference to minutes
+    return ctx.df.assign(response_time=response_time.where(response_time < 1440))
+
+
+@profiled
+def calculate_silent_periods(selected_user, df):
+    ctx = analysis_context(selected_user, df)
+    segments = ctx.segments(members=False)
+
+    gap_hours = pd.Series(segments.gaps / 3600, index=ctx.df.index[segments.order], name='gap_hours')  # Convert gap to hours
+    silent_periods = gap_hours[gap_hours > 1]  # Filter gaps > 1 hour
+    return silent_periods
+
+
+@profiled
+@columnar.dispatch
+def get_most_active_user(df: pd.DataFrame):
+
+    if df.empty or 'user' not in df.columns or 'message' not in df.columns:
+        return "No active user"
+
+    message_counts = df.groupby("user", observed=True)["message"].count().reset_index()
+
+    if message_counts.empty:
+        return "No active user"
+
+    most_active = message_counts.sort_values("message", ascending=False).iloc[0]
+
+    return most_active["user"]
+
+
+def _fold_others(totals, users, top_n):
+    # Keeps the columns of the top_n busiest users, in their order, and sums
+    # the rest of a (rows x users) array into one 'Others' column.
+    if top_n is None or len(users) <= top_n:
+        return totals, users
+    busiest = np.sort(np.argsort(-totals.sum(axis=0), kind='stable')[:top_n])
+    rest = np.setdiff1d(np.arange(len(users)), busiest)
+    totals = np.column_stack([totals[:, busiest], totals[:, rest].sum(axis=1)])
+    return totals, pd.Index(list(users[busiest]) + ['Others'])
+
+
+@profiled
+def smoothed_daily_activity( selected_user, df: pd.DataFrame, years: int = 3, top_n=None):
+    # Daily msg_length per user over the last `years` years, smoothed over days.
+    # Built from the activity cube with one bincount, so memory is days x active
+    # users. With top_n, only the busiest users keep a column; the rest are
+    # summed into 'Others'.
+    chat_cube = analysis_context(selected_user, df).cube
+
+    year = chat_cube["date"].dt.year
+    chat_cube = chat_cube[year > year.max() - years]
+
+    if chat_cube.empty:
+        return pd.DataFrame(index=pd.DatetimeIndex([], name='date', freq='D'), columns=pd.Index([], name='user'))
+
+    first_day = chat_cube["date"].min()
+    day = ((chat_cube["date"] - first_day) // pd.Timedelta(days=1)).to_numpy()
+    user_codes, users = pd.factorize(chat_cube["user"].astype(object), sort=True)
+    days = day.max() + 1
+
+    totals = np.bincount(day * len(users) + user_codes, weights=chat_cube["msg_length"].to_numpy(),
+                         minlength=days * len(users)).reshape(days, len(users))
+
+    totals, users = _fold_others(totals, users, top_n)
+
+    from scipy.ndimage import gaussian_filter1d
+    smoothed_daily_activity_df = pd.DataFrame(
+        gaussian_filter1d(totals, 6, axis=0),
+        index=pd.date_range(first_day, periods=days, freq='D', name='date'),
+        columns=pd.Index(users, name='user'))
+    return smoothed_daily_activity_df
+
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def time_of_day_activity(selected_user, df: pd.DataFrame, top_n=None):
+    # Smoothed msg_length per minute of the day (1440 rows) and user. The day
+    # wraps around, so activity just before midnight bleeds into 00:00.
+    df = analysis_context(selected_user, df).df
+    # Messages whose header did not parse have no time of day.
+    df = df[df['date'].notna()]
+
+    minute = (df['date'].dt.hour * 60 + df['date'].dt.minute).to_numpy(dtype=np.int64)
+    user_codes, users = pd.factorize(df['user'].astype(object), sort=True)
+
+    totals = np.bincount(minute * len(users) + user_codes, weights=df['msg_length'].to_numpy(),
+                         minlength=MINUTES_PER_DAY * len(users)).reshape(MINUTES_PER_DAY, len(users))
+
+    totals, users = _fold_others(totals, users, top_n)
+
+    from scipy.ndimage import gaussian_filter1d
+    return pd.DataFrame(gaussian_filter1d(totals, 3, axis=0, mode='wrap'),
+                        index=pd.RangeIndex(MINUTES_PER_DAY, name='minute'), columns=pd.Index(users, name='user'))
+
+
+@profiled
+def activity_time_of_day_ts(selected_user, df: pd.DataFrame, top_n: int = 10, step: int = 5):
+    # Nothing to chart without a message that has a time.
+    if analysis_context(selected_user, df).df['date'].isna().all():
+        return None
+
+    # The chart gets one point per `step` minutes (the mean over it) and at
+    # most top_n user lines, so the spec stays small for big groups.
+    smoothed = time_of_day_activity(selected_user, df, top_n)
+    binned = smoothed.to_numpy().reshape(-1, step, smoothed.shape[1]).mean(axis=1)
+    times = pd.Timestamp('1970-01-01') + pd.to_timedelta(np.arange(0, MINUTES_PER_DAY, step), unit='min')
+
+    melted = pd.DataFrame({
+        'time': np.tile(times, binned.shape[1]),
+        'user': np.repeat(smoothed.columns.to_numpy(), binned.shape[0]),
+        'activity': binned.T.ravel(),
+    })
+
+    import altair as alt
+    chart = alt.Chart(melted).mark_line(interpolate='monotone').encode(
+        x=alt.X('time:T', title='Time of Day', axis=alt.Axis(format='%H:%M')),
+        y=alt.Y('activity:Q', title='Activity'),
+        color=alt.Color('user:N', title='User')
+    ).properties(
+        width=800,
+        height=400
+    )
+
+    return chart
+
+
+@profiled
+def activity_day_of_week_ts(df: pd.DataFrame, selected_user):
+    members = cube.without_user(analysis_context(selected_user, df).cube, 'group_notification')
+
+    if members.empty:
+        return None
+
+    days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+    o = cube.by_weekday_user(members, 'msg_length').unstack(fill_value=0)
+    o.index = pd.CategoricalIndex(o.index.map(lambda x: days[int(x)]), categories=days, ordered=True)
+    o = o.sort_index()
+
+    o_normalized = o.div(o.sum(axis=0), axis=1)
+
+    o_normalized.index.name = 'day_of_week'
+
+    o_melted = o_normalized.reset_index().melt(id_vars='day_of_week', var_name='user', value_name='activity')
+
+    import altair as alt
+    chart = alt.Chart(o_melted).mark_rect().encode(
+        x=alt.X('day_of_week:N', sort=days, title='Day of Week'),
+        y=alt.Y('user:N', title='Author'),
+        color=alt.Color('activity:Q', scale=alt.Scale(scheme='viridis'), title='Activity'),
+        tooltip=[
+            alt.Tooltip('day_of_week:N', title='Day'),
+            alt.Tooltip('user:N', title='Author'),
+            alt.Tooltip('activity:Q', title='Activity', format='.1%')
+        ]
+    ).properties(
+        width=600,
+        height=400
+    )
+
+    text = chart.mark_text(baseline='middle').encode(
+        text=alt.Text('activity:Q', format='.1%'),
+        color=alt.condition(
+            alt.datum.activity > 0.15,
+            alt.value('white'),
+            alt.value('black')
+        )
+    )
+
+    return chart + text
+
+
+@profiled
+def sentiment_analysis(df, selected_user):
+    ctx = analysis_context(selected_user, df)
+    df = ctx.df
+
+    if df.empty:
+        return None
+
+    labels = sentiment.label(ctx.sentiment_scores)
+
+    sentiment_counts = labels.value_counts().reset_index()
+    sentiment_counts.columns = ["sentiment", "count"]
+
+    return sentiment_counts
+
+
+@profiled
+@columnar.dispatch
+def find_longest_consecutive_streak(df: pd.DataFrame, selected_user):
+    ctx = analysis_context(selected_user, df)
+
+    if ctx.df.empty:
+        return None
+
+    segments = ctx.segments(members=False)
+
+    run_lengths = np.bincount(segments.run_ids)
+    run_starts = np.flatnonzero(np.r_[True, np.diff(segments.run_ids) > 0])
+    run_users = segments.users[run_starts]
+
+    # Ties go to the alphabetically first user, then to their earliest streak.
+    longest = np.flatnonzero(run_lengths == run_lengths.max())
+    longest_run = longest[np.lexsort((longest, run_users[longest]))[0]]
+
+    streak_data = ctx.df.iloc[segments.order[segments.run_ids == longest_run]]
+
+    return {
+        'user': segments.names[run_users[longest_run]],
+        'streak_length': run_lengths[longest_run],
+        'start_time': streak_data['date'].min(),
+        'end_time': streak_data['date'].max(),
+        'streak_messages': streak_data[['date', 'user', 'message']]
+    }
+
+@profiled
+@columnar.dispatch
+def median_response_times(selected_user, df):
+    segments = analysis_context(selected_user, df).segments()
+
+    # Quick follow-ups by the same author are not responses.
+    keep = ~((segments.gaps < 180) & segmentation.same_author(segments))
+
+    response_data = pd.DataFrame({
+        'user': segments.names[segments.users[keep]],
+        'response_time': segments.gaps[keep] / 60,
+    })
+
+    return response_data.groupby('user')['response_time'].median().reset_index()
+
+
+@profiled
+def analyze_response_time(df: pd.DataFrame, selected_user):
+    median_response_time = median_response_times(selected_user, df)
+
+    import altair as alt
+    median_chart = alt.Chart(median_response_time).mark_bar().encode(
+        y=alt.Y('user:N', sort='-x'),
+        x=alt.X('response_time:Q', title='Median Response Time (minutes)'),
+        color='user:N'
+    )
+
+    return {
+        'median_chart': median_chart,
+        'slowest_responder': median_response_time.loc[median_response_time['response_time'].idxmax(), 'user']
+    }
+
+@profiled
+def plot_most_talkative_day(df):
+    counts = cube.by_date(analysis_context('Everyone', df).cube)
+
+    daily_message_counts = pd.Series(counts.to_numpy(), index=pd.Index(counts.index.date, name='date'), name='message')
+
+    most_talkative_day = daily_message_counts.idxmax()
+    highest_message_count = daily_message_counts.max()
+
+    return daily_message_counts, most_talkative_day, highest_message_count
+
+
+@profiled
+def assign_chat_badges(df):
+    badges = {}
+
+    ctx = analysis_context('Everyone', df)
+    df = ctx.chat_members
+
+    emoji_count = ctx.emoji_counts[~ctx.notification_mask]
+    emoji_master = emoji_count.groupby(df['user'], observed=True).sum().idxmax()
+    badges[emoji_master] = "Emoji Master 🏆"
+
+    gif_messages = df[ctx.media_mask[~ctx.notification_mask]]
+    gif_guru = value_counts(gif_messages['user']).idxmax() if not gif_messages.empty else None
+    if gif_guru:
+        badges[gif_guru] = "GIF Guru 🎥"
+
+    hour = pd.to_datetime(df['date']).dt.hour
+    late_night_messages = df[(hour >= 0) & (hour < 6)]
+    late_night_texter = value_counts(late_night_messages['user']).idxmax() if not late_night_messages.empty else None
+    if late_night_texter:
+        badges[late_night_texter] = "Late Night Texter 🌙"
+
+    top_chatter = value_counts(df['user']).idxmax()
+    badges[top_chatter] = "Top Chatter 💬"
+
+    silent_observer = value_counts(df['user']).idxmin()
+    badges[silent_observer] = "Silent Observer 🤐"
+
+    return badges
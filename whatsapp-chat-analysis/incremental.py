@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+import shutil
+from itertools import chain
+
+import pandas as pd
+
+import aggregates
+import cache
+import preprocessor
+
+CHATS_DIR = os.path.join(cache.CACHE_DIR, 'chats')
+
+# Bump when the stored parts or metadata change shape; older chats are rebuilt.
+STORE_VERSION = 3
+
+# A chat is recognised by its opening messages, which every later export repeats.
+IDENTITY_MESSAGES = 10
+
+
+def _hash(*parts):
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def chat_id(batch):
+    count = min(IDENTITY_MESSAGES, len(batch['user_message']))
+    return _hash(*batch['message_date'][:count], *batch['user_message'][:count])
+
+
+def identify(source, chat_format=None):
+    # The chat_id of an export without parsing past its first batch, or None
+    # for an empty one.
+    batches, _ = preprocessor.read_export(source, chat_format)
+    first = next(batches, None)
+    return None if first is None else chat_id(first)
+
+
+def chat_dir(key):
+    return os.path.join(CHATS_DIR, key)
+
+
+def _store_meta(directory, meta):
+    tmp_path = os.path.join(directory, '.meta.json.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(meta, file)
+    os.replace(tmp_path, os.path.join(directory, 'meta.json'))
+
+
+def skip_known(batches, meta):
+    # Drops the messages already stored for this chat and returns the rest, or
+    # None when the export does not continue the stored one (it was edited, or
+    # is older). The last stored message must reappear at the same position with
+    # the same header and text.
+    count = meta['message_count']
+    if count == 0:
+        return None
+
+    seen = 0
+    for batch in batches:
+        size = len(batch['user_message'])
+        if seen + size < count:
+            seen += size
+            continue
+
+        i = count - 1 - seen
+        if (batch['message_date'][i] != meta['last_header']
+                or _hash(batch['user_message'][i]) != meta['last_message_hash']):
+            return None
+        rest = {column: values[i + 1:] for column, values in batch.items()}
+        return chain([rest], batches)
+    return None
+
+
+def _track(batches, meta):
+    for batch in batches:
+        if not batch['user_message']:
+            continue
+        meta['message_count'] += len(batch['user_message'])
+        meta['last_header'] = batch['message_date'][-1]
+        meta['last_message_hash'] = _hash(batch['user_message'][-1])
+        yield batch
+
+
+def _load_frame(directory, meta):
+    parts = [pd.read_parquet(os.path.join(directory, part)) for part in meta['parts']]
+    return pd.concat(parts, ignore_index=True) if parts else None
+
+
+def _restore_dtypes(df, options):
+    if options['compact']:
+        # Parts carry their own user categories; unify them once after concat.
+        return preprocessor.compact_frame(df, options['arrow_messages'])
+    return df
+
+
+def ingest(source, key=None, chat_format=None, compact=False, arrow_messages=False):
+    # Parses a chat export, reusing whatever an earlier export of the same chat
+    # already stored: only messages after the stored ones are parsed, appended as
+    # a new part and folded into the stored aggregates. Returns
+    # (df, start_date, last_date, tables).
+    options = {'version': STORE_VERSION, 'compact': compact, 'arrow_messages': arrow_messages}
+    batches, chat_format = preprocessor.read_export(source, chat_format)
+
+    first = next(batches, None)
+    if first is None:
+        df = preprocessor.build_frame([], chat_format, compact, arrow_messages)
+        return (df, None, None, {})
+    batches = chain([first], batches)
+
+    key = key or chat_id(first)
+    directory = chat_dir(key)
+    meta = cache.load_meta(directory)
+
+    tail = None
+    if meta is not None and meta['options'] == options and meta['chat_format'] == chat_format:
+        tail = skip_known(batches, meta)
+
+    if tail is None:
+        if meta is not None:
+            # skip_known may have consumed part of the export; start it over.
+            batches, chat_format = preprocessor.read_export(source, chat_format)
+        shutil.rmtree(directory, ignore_errors=True)
+        meta = {'options': options, 'chat_format': chat_format, 'message_count': 0, 'parts': []}
+        tail = batches
+    os.makedirs(directory, exist_ok=True)
+
+    previous = _load_frame(directory, meta)
+    tables = aggregates.load(directory) if previous is not None else {}
+
+    new_rows = preprocessor.build_frame(_track(tail, meta), chat_format, compact, arrow_messages)
+    if not new_rows.empty:
+        part = f'part-{len(meta["parts"]):05d}.parquet'
+        new_rows.to_parquet(os.path.join(directory, part), index=False)
+        meta['parts'].append(part)
+
+        tables = aggregates.merge(tables, aggregates.compute(new_rows))
+        aggregates.save(directory, tables)
+    # Rewritten even when nothing is new, which marks the store as recently
+    # used for cache eviction.
+    _store_meta(directory, meta)
+    cache.evict()
+
+    if previous is None:
+        df = new_rows
+    elif new_rows.empty:
+        df = _restore_dtypes(previous, options)
+    else:
+        df = _restore_dtypes(pd.concat([previous, new_rows], ignore_index=True), options)
+
+    return (df, *cache._date_range(df), tables)
@@ -0,0 +1,56 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import chain
+
+import pandas as pd
+
+from profiling import profiled
+
+# URLExtract only finds URLs with a dot (a TLD, or an IP address) or an
+# explicit scheme, so messages with neither never reach it.
+CANDIDATE_PATTERN = r'\.|://'
+
+POOL_MIN_MESSAGES = 50_000
+BATCH_SIZE = 10_000
+
+_extractor = None
+
+
+def _get_extractor():
+    global _extractor
+    if _extractor is None:
+        from urlextract import URLExtract
+        _extractor = URLExtract()
+    return _extractor
+
+
+@lru_cache(maxsize=100_000)
+def find_urls(message):
+    return tuple(_get_extractor().find_urls(message))
+
+
+def find_urls_batch(messages):
+    return [find_urls(message) for message in messages]
+
+
+def _find_all(messages, workers=None):
+    if workers == 1 or len(messages) < POOL_MIN_MESSAGES:
+        return find_urls_batch(messages)
+
+    batches = [messages[start:start + BATCH_SIZE] for start in range(0, len(messages), BATCH_SIZE)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(chain.from_iterable(pool.map(find_urls_batch, batches)))
+
+
+@profiled(name='links.extract')
+def extract(messages, workers=None):
+    # One row per URL, indexed by the message it came from.
+    candidates = messages[messages.str.contains(CANDIDATE_PATTERN, regex=True).astype(bool)]
+    found = pd.Series(_find_all(candidates.astype(object).tolist(), workers), index=candidates.index, dtype=object)
+    return found.explode().dropna().astype(object)
+
+
+def counts_by_user(users, found):
+    # found is the output of extract(); users is the matching 'user' column.
+    counts = pd.Series(users.loc[found.index].to_numpy()).value_counts()
+    return counts.rename_axis('user').rename('links')
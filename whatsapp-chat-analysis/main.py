@@ -1,290 +1,453 @@
-import streamlit as st
-import preprocessor,helper
-import matplotlib.pyplot as plt
-import seaborn as sns
-import pandas as pd
-import altair as alt
-import numpy as np
-
-
-st.set_page_config(
-    page_title="Whatsapp Group Chat Analyzer",
-    page_icon="🗣",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
-
-st.cache_data.clear()
-st.cache_resource.clear()
-
-st.title("💭 Whatsapp Chat Analyzer")
-
-
-uploaded_file = st.file_uploader("Choose a file (should be .txt format)")
-
-
-if uploaded_file is not None:
-    if uploaded_file.name.endswith(".txt"):
-        with st.spinner("Processing your file. Please wait..."):
-            try:
-                bytes_data = uploaded_file.getvalue()
-                data = bytes_data.decode("utf-8")
-                df, start_date, last_date = preprocessor.preprocess(data)
-
-
-                user_list = df['user'].unique().tolist()
-                if 'group_notification' in user_list:
-                    user_list.remove('group_notification')
-                user_list.sort()
-                user_list.insert(0,"Everyone")
-
-                selected_user = st.selectbox("Show analysis of:",user_list)
-
-                if st.button("Show Analysis"):
-
-                    num_messages, words, num_media_messages, num_links = helper.fetch_stats(selected_user,df)
-
-                    col1, col2 = st.columns(2)
-
-                    with col1:
-                        st.metric("Total Messages", f"{num_messages}")
-                        st.metric("Total Words", words)
-                        st.metric("Most Active Chatter", helper.get_most_active_user(df))
-
-                    with col2:
-                        st.metric("Media Shared", num_media_messages)
-                        st.metric("Links Shared", num_links)
-                        total_days = (last_date - start_date).days + 1
-                        st.metric("Chat Duration", total_days)
-
-                    st.markdown(f"""
-                                   📈 Chat started from {start_date.strftime('%B %d, %Y')} to {last_date.strftime('%B %d, %Y')}
-            
-                                   🏆 **{helper.get_most_active_user(df)}** has most number of messages !
-                                   
-                                   """)
-
-
-                    #Message Volume
-                    st.write("""## Messages Volume Over Time""")
-
-                    smoothed_daily_activity_df = helper.smoothed_daily_activity(selected_user,df=df, years=3)
-                    st.area_chart(smoothed_daily_activity_df)
-
-
-                    #Monthy Analysis
-                    st.markdown(""" ## Monthly Analysis """)
-                    timeline = helper.monthly_timeline(selected_user, df)
-                    timeline.set_index("time", inplace=True)
-                    st.line_chart(timeline["message"])
-
-
-                    #Daily Analysis
-                    st.markdown(" ## Daily Analysis")
-                    daily_timeline = helper.daily_timeline(selected_user, df)
-                    daily_timeline.set_index("only_date", inplace=True)
-                    st.line_chart(daily_timeline["message"])
-
-
-                    #Most Active Day
-                    st.markdown(" ## Most active day")
-                    busy_day, new_df = helper.week_activity_map(selected_user,df)
-                    col1, col2 = st.columns(2)
-
-                    with col1:
-                        st.bar_chart(busy_day)
-
-                    with col2:
-                        st.dataframe(new_df)
-
-                    #Most Active Month
-                    st.markdown(" ## Most active month")
-                    busy_month = helper.month_activity_map(selected_user, df)
-                    st.bar_chart(busy_month)
-
-                    if selected_user != 'Overall':
-                        st.markdown("## Most Talkative Day")
-
-                        daily_message_counts, most_talkative_day, message_count = helper.plot_most_talkative_day(df)
-
-                        if message_count > 0:
-                            st.line_chart(daily_message_counts)
-                            st.markdown(
-                                f"🎉 The most talkative day was **{most_talkative_day}** with **{message_count}** messages!")
-                        else:
-                            st.markdown("No messages found to analyze the most talkative day.")
-
-                    #Weekly Heatmap
-                    st.markdown(" ## Weekly Activity Map")
-                    user_heatmap = helper.activity_heatmap(selected_user,df)
-                    fig, ax = plt.subplots(figsize=(10, 6))
-                    sns.heatmap(user_heatmap, cmap="coolwarm", annot=True, fmt=".0f", linewidths=0.5, ax=ax)
-                    st.pyplot(fig)
-
-                    #Most Active Person
-                    if selected_user == 'Everyone':
-                        st.markdown(' ## Most Active Person')
-                        x,new_df = helper.most_busy_users(selected_user,df)
-                        fig, ax = plt.subplots()
-
-                        col1, col2 = st.columns(2)
-
-                        with col1:
-                            st.bar_chart(x)
-                        with col2:
-                            st.dataframe(new_df)
-
-                    # WordCloud
-                    st.write("## Most Used Words (Word Cloud)")
-                    st.subheader("Here are some most used words:")
-                    word_cloud = helper.create_word_cloud(df)
-                    st.image(word_cloud)
-
-                    #Message Activity(day)
-                    st.write("""
-                                        ## Message Activity by Time of Day
-                                        """)
-                    time_of_day_data = helper.activity_time_of_day_ts(selected_user, df)
-                    st.altair_chart(time_of_day_data)
-
-
-                    #Message Activity(week)
-                    st.write("""
-                                        ## Message Activity by Day of Week
-                                        """)
-
-                    day_of_week_data = helper.activity_day_of_week_ts(df,selected_user)
-                    st.altair_chart(day_of_week_data)
-
-                    #Words
-                    most_common_df = helper.most_common_words(selected_user, df)
-                    most_common_df.columns = ["Word", "Count"]
-
-                    chart = alt.Chart(most_common_df).mark_bar().encode(
-                        x=alt.X("Count:Q", title="Frequency"),
-                        y=alt.Y("Word:N", sort="-x", title="Word"),
-                        color=alt.Color("Word:N", legend=None)  # Optional: different color per word
-                    ).properties(
-                        title="Most Common Words",
-                        width=600,
-                        height=400
-                    )
-
-                    st.markdown(" ## Most Common Words")
-                    st.altair_chart(chart, use_container_width=True)
-
-
-                    #Conversation Starter
-                    st.markdown("### Conversation Starters")
-                    col1, col2= st.columns(2)
-
-                    starter_df = helper.identify_conversation_starters(selected_user, df)
-
-
-                    with col1:
-                        st.bar_chart(starter_df.set_index('User')['Conversation Starts'])
-
-                    with col2:
-                        st.dataframe(starter_df)
-
-
-
-                    #Consecutive Message
-                    if selected_user == 'Everyone':
-                        st.write("## Consecutive Message Analysis")
-
-                        streak_info = helper.find_longest_consecutive_streak(df, selected_user)
-                        st.write(f"User with the longest streak: {streak_info['user']} 🎊")
-                        st.write(f"**Streak Length:** {streak_info['streak_length']} messages")
-                        st.write(f"**Start Time:** {streak_info['start_time']}")
-                        st.write(f"**End Time:** {streak_info['end_time']}")
-
-                        st.dataframe(streak_info["streak_messages"])
-
-                        chart_data = pd.DataFrame({
-                            "User": [streak_info["user"]],
-                            "Streak Length": [streak_info["streak_length"]]
-                        })
-
-                        chart = alt.Chart(chart_data).mark_bar().encode(
-                            x=alt.X("Streak Length:Q", title="Number of Messages"),
-                            y=alt.Y("User:N", title="User"),
-                            color=alt.Color("User:N", legend=None)
-                        ).properties(
-                            width=600,
-                            height=200,
-                            title="Longest Consecutive Streak"
-                        )
-
-                        st.altair_chart(chart, use_container_width=True)
-
-
-                    #Response Time
-                    st.write("""
-                                        ## Response Time Analysis
-                                        """)
-
-                    response_time_analysis = helper.analyze_response_time(df, selected_user)
-
-                    st.altair_chart(response_time_analysis['median_chart'], use_container_width=True)
-
-                    slowest_responder = response_time_analysis['slowest_responder']
-
-                    #Emoji
-                    emoji_df = helper.emoji_helper(selected_user, df)
-                    st.title("Emoji Analysis")
-                    if not emoji_df.empty:
-                        st.markdown("## Emoji Analysis")
-
-                        col1, col2 = st.columns(2)
-
-                        with col1:
-                            st.dataframe(emoji_df.head(20))
-                        with col2:
-                            fig, ax = plt.subplots()
-                            ax.pie(emoji_df[1].head(), labels=emoji_df[0].head(), autopct="%0.2f")
-                            st.pyplot(fig)
-                    else:
-                        st.markdown("No emojis found in the chat.")
-
-
-
-
-                    #Sentiment Analysis
-                    sentiment_counts = helper.sentiment_analysis(df, selected_user)
-
-                    chart = alt.Chart(sentiment_counts).mark_bar().encode(
-                        x=alt.X("sentiment", title="Sentiment"),
-                        y=alt.Y("count", title="Message Count"),
-                        color=alt.Color("sentiment", legend=None),
-                    ).properties(
-                        title="Sentiment Analysis",
-                        width=600,
-                        height=400
-                    )
-
-                    st.title("Sentiment Analysis")
-                    st.altair_chart(chart, use_container_width=True)
-
-
-                    #Awards
-                    if selected_user == 'Everyone':
-                        st.markdown("## Chat Badges 🏅")
-                        badges = helper.assign_chat_badges(df)
-
-                        for user, badge in badges.items():
-                            st.markdown(f"**{user}**: {badge}")
-
-
-
-            except Exception as e:
-                st.error(f"Error during preprocessing: {e}")
-
-
-
-
-
-
-
-
-
+import streamlit as st
+import aggregates,archives,cache,columnar,context,helper,incremental,profiling,word_cloud,workspace
+from contextlib import ExitStack
+import pandas as pd
+import numpy as np
+
+
+st.set_page_config(
+    page_title="Whatsapp Group Chat Analyzer",
+    page_icon="🗣",
+    layout="wide",
+    initial_sidebar_state="expanded"
+)
+
+st.title("💭 Whatsapp Chat Analyzer")
+
+
+# Heavy computations behind each dashboard section. A section only runs when it
+# is opened, and its result is kept per (chat hash, user, section).
+SECTION_DATA = {
+    "Messages Volume": lambda user, df: helper.smoothed_daily_activity(user, df=df, years=3, top_n=10),
+    "Timelines": lambda user, df: (helper.monthly_timeline(user, df), helper.daily_timeline(user, df)),
+    "Activity Maps": lambda user, df: (
+        helper.week_activity_map(user, df),
+        helper.month_activity_map(user, df),
+        helper.plot_most_talkative_day(df),
+        helper.activity_heatmap(user, df),
+    ),
+    "Most Active Person": lambda user, df: helper.most_busy_users(user, df),
+    "Word Cloud": lambda user, df: helper.word_cloud_frequencies(user, df),
+    "Activity by Time": lambda user, df: (
+        helper.activity_time_of_day_ts(user, df),
+        helper.activity_day_of_week_ts(df, user),
+    ),
+    "Most Common Words": lambda user, df: helper.most_common_words(user, df),
+    "Conversations": lambda user, df: (
+        helper.identify_conversation_starters(user, df),
+        helper.find_longest_consecutive_streak(df, user) if user == 'Everyone' else None,
+        helper.analyze_response_time(df, user),
+    ),
+    "Emoji Analysis": lambda user, df: helper.emoji_helper(user, df),
+    "Sentiment Analysis": lambda user, df: helper.sentiment_analysis(df, user),
+    "Chat Badges": lambda user, df: helper.assign_chat_badges(df),
+}
+
+EVERYONE_ONLY = {"Most Active Person", "Chat Badges"}
+
+# Sections whose helpers also run against an on-disk dataset.
+OUT_OF_CORE_SECTIONS = ["Messages Volume", "Timelines", "Activity Maps", "Most Active Person", "Conversations"]
+
+DEFAULT_SECTIONS = ["Timelines", "Activity Maps"]
+
+EXPORT_TYPES = [suffix.lstrip('.') for suffix in archives.SUFFIXES]
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def load_chat(chat_key, _source):
+    # A newer export of a chat opened before parses only its new messages, and
+    # its stored activity table serves as the cube.
+    df, start_date, last_date, tables = incremental.ingest(_source)
+    if 'activity' in tables:
+        context.attach_cube(df, aggregates.activity_cube(tables['activity']))
+    return df, start_date, last_date
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def load_dataset(chat_key, _source):
+    dataset = columnar.open_dataset(_source, key=chat_key)
+    return dataset, *dataset.date_range()
+
+
+@st.cache_resource(max_entries=256, show_spinner=False)
+def section_data(chat_key, selected_user, section, _df):
+    return SECTION_DATA[section](selected_user, _df)
+
+
+@st.cache_resource(show_spinner=False)
+def load_workspace():
+    return workspace.Workspace()
+
+
+def render_workspace(chats):
+    added = st.session_state.setdefault('workspace_files', set())
+    uploads = st.file_uploader("Add chats (.txt, .zip, .gz or .zst exports)", type=EXPORT_TYPES,
+                               accept_multiple_files=True)
+    for upload in uploads or []:
+        upload_key = cache.cache_key(upload)
+        if upload_key in added:
+            continue
+        with st.spinner(f"Adding {upload.name}..."), profiling.stage('workspace.add'):
+            chats.add(upload, archives.chat_name(upload.name))
+        added.add(upload_key)
+
+    summary = chats.summary()
+    if summary.empty:
+        st.info("Add one or more chat exports to compare them.")
+        return
+
+    st.header("Chats")
+    st.dataframe(summary.drop(columns='chat_id'))
+    removed = st.selectbox("Remove a chat", ["-", *summary.index])
+    if removed != "-" and st.button("Remove"):
+        chats.remove(summary.loc[removed, 'chat_id'])
+        st.rerun()
+
+    with profiling.stage('workspace.views'):
+        timeline = chats.volume_timeline()
+        top = chats.top_users()
+        by_user = chats.user_activity(top.index)
+        sentiment_share = chats.sentiment_by_chat()
+
+    st.header("Total Volume")
+    st.area_chart(timeline)
+
+    st.header("Most Active People Across Chats")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.dataframe(top)
+    with col2:
+        st.bar_chart(by_user)
+
+    st.header("Sentiment by Chat")
+    st.bar_chart(sentiment_share, horizontal=True)
+
+
+def render_messages_volume(selected_user, smoothed_daily_activity_df):
+    st.area_chart(smoothed_daily_activity_df)
+
+
+def render_timelines(selected_user, data):
+    timeline, daily_timeline = data
+
+    #Monthy Analysis
+    st.markdown(""" ## Monthly Analysis """)
+    st.line_chart(timeline.set_index("time")["message"])
+
+    #Daily Analysis
+    st.markdown(" ## Daily Analysis")
+    st.line_chart(daily_timeline.set_index("only_date")["message"])
+
+
+def render_activity_maps(selected_user, data):
+    (busy_day, new_df), busy_month, talkative_day, user_heatmap = data
+
+    #Most Active Day
+    st.markdown(" ## Most active day")
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.bar_chart(busy_day)
+
+    with col2:
+        st.dataframe(new_df)
+
+    #Most Active Month
+    st.markdown(" ## Most active month")
+    st.bar_chart(busy_month)
+
+    if selected_user != 'Overall':
+        st.markdown("## Most Talkative Day")
+
+        daily_message_counts, most_talkative_day, message_count = talkative_day
+
+        if message_count > 0:
+            st.line_chart(daily_message_counts)
+            st.markdown(
+                f"🎉 The most talkative day was **{most_talkative_day}** with **{message_count}** messages!")
+        else:
+            st.markdown("No messages found to analyze the most talkative day.")
+
+    #Weekly Heatmap
+    st.markdown(" ## Weekly Activity Map")
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    fig, ax = plt.subplots(figsize=(10, 6))
+    sns.heatmap(user_heatmap, cmap="coolwarm", annot=True, fmt=".0f", linewidths=0.5, ax=ax)
+    st.pyplot(fig)
+
+
+def render_most_active_person(selected_user, data):
+    x,new_df = data
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.bar_chart(x)
+    with col2:
+        st.dataframe(new_df)
+
+
+def render_word_cloud(selected_user, word_freq):
+    st.subheader("Here are some most used words:")
+    if word_freq.empty:
+        st.markdown("No words found to draw a word cloud.")
+        return
+
+    # A coarse preview goes up first unless the full image is already cached.
+    image = st.empty()
+    if not word_cloud.is_cached(word_freq):
+        image.image(word_cloud.render(word_freq, preview=True))
+    image.image(word_cloud.render(word_freq))
+
+
+def render_activity_by_time(selected_user, data):
+    time_of_day_data, day_of_week_data = data
+
+    #Message Activity(day)
+    st.write("""
+                        ## Message Activity by Time of Day
+                        """)
+    st.altair_chart(time_of_day_data)
+
+    #Message Activity(week)
+    st.write("""
+                        ## Message Activity by Day of Week
+                        """)
+    st.altair_chart(day_of_week_data)
+
+
+def render_most_common_words(selected_user, most_common_df):
+    most_common_df = most_common_df.set_axis(["Word", "Count"], axis=1)
+
+    import altair as alt
+    chart = alt.Chart(most_common_df).mark_bar().encode(
+        x=alt.X("Count:Q", title="Frequency"),
+        y=alt.Y("Word:N", sort="-x", title="Word"),
+        color=alt.Color("Word:N", legend=None)  # Optional: different color per word
+    ).properties(
+        title="Most Common Words",
+        width=600,
+        height=400
+    )
+
+    st.altair_chart(chart, use_container_width=True)
+
+
+def render_conversations(selected_user, data):
+    starter_df, streak_info, response_time_analysis = data
+
+    #Conversation Starter
+    st.markdown("### Conversation Starters")
+    col1, col2= st.columns(2)
+
+    with col1:
+        st.bar_chart(starter_df.set_index('User')['Conversation Starts'])
+
+    with col2:
+        st.dataframe(starter_df)
+
+    #Consecutive Message
+    if streak_info is not None:
+        st.write("## Consecutive Message Analysis")
+
+        st.write(f"User with the longest streak: {streak_info['user']} 🎊")
+        st.write(f"**Streak Length:** {streak_info['streak_length']} messages")
+        st.write(f"**Start Time:** {streak_info['start_time']}")
+        st.write(f"**End Time:** {streak_info['end_time']}")
+
+        st.dataframe(streak_info["streak_messages"])
+
+        chart_data = pd.DataFrame({
+            "User": [streak_info["user"]],
+            "Streak Length": [streak_info["streak_length"]]
+        })
+
+        import altair as alt
+        chart = alt.Chart(chart_data).mark_bar().encode(
+            x=alt.X("Streak Length:Q", title="Number of Messages"),
+            y=alt.Y("User:N", title="User"),
+            color=alt.Color("User:N", legend=None)
+        ).properties(
+            width=600,
+            height=200,
+            title="Longest Consecutive Streak"
+        )
+
+        st.altair_chart(chart, use_container_width=True)
+
+    #Response Time
+    st.write("""
+                        ## Response Time Analysis
+                        """)
+
+    st.altair_chart(response_time_analysis['median_chart'], use_container_width=True)
+
+
+def render_emoji_analysis(selected_user, emoji_df):
+    if not emoji_df.empty:
+        col1, col2 = st.columns(2)
+
+        with col1:
+            st.dataframe(emoji_df.head(20))
+        with col2:
+            import matplotlib.pyplot as plt
+            fig, ax = plt.subplots()
+            ax.pie(emoji_df[1].head(), labels=emoji_df[0].head(), autopct="%0.2f")
+            st.pyplot(fig)
+    else:
+        st.markdown("No emojis found in the chat.")
+
+
+def render_sentiment_analysis(selected_user, sentiment_counts):
+    import altair as alt
+    chart = alt.Chart(sentiment_counts).mark_bar().encode(
+        x=alt.X("sentiment", title="Sentiment"),
+        y=alt.Y("count", title="Message Count"),
+        color=alt.Color("sentiment", legend=None),
+    ).properties(
+        title="Sentiment Analysis",
+        width=600,
+        height=400
+    )
+
+    st.altair_chart(chart, use_container_width=True)
+
+
+def render_chat_badges(selected_user, badges):
+    for user, badge in badges.items():
+        st.markdown(f"**{user}**: {badge}")
+
+
+SECTION_RENDERERS = {
+    "Messages Volume": render_messages_volume,
+    "Timelines": render_timelines,
+    "Activity Maps": render_activity_maps,
+    "Most Active Person": render_most_active_person,
+    "Word Cloud": render_word_cloud,
+    "Activity by Time": render_activity_by_time,
+    "Most Common Words": render_most_common_words,
+    "Conversations": render_conversations,
+    "Emoji Analysis": render_emoji_analysis,
+    "Sentiment Analysis": render_sentiment_analysis,
+    "Chat Badges": render_chat_badges,
+}
+
+
+with st.sidebar:
+    out_of_core = st.checkbox("Out-of-core mode", help="Keep the parsed chat on disk and query it with DuckDB, "
+                                                       "for exports too large for memory. Fewer sections are available.")
+    workspace_mode = st.checkbox("Workspace", help="Add many chats and compare them; kept between sessions")
+    show_performance = st.checkbox("Performance", help="Time every stage of this run")
+    if show_performance:
+        track_memory = st.checkbox("Track peak memory", help="Slows the run down noticeably")
+        deep_profile = st.checkbox("cProfile this run")
+
+run_profile = None
+profile_stack = ExitStack()
+if show_performance:
+    profiling.enable(memory=track_memory)
+    # Released by this run's thread; the next rerun starts on a fresh one.
+    profile_stack.callback(profiling.disable)
+    profiling.reset()
+    if deep_profile:
+        run_profile = profile_stack.enter_context(profiling.cprofile())
+else:
+    profiling.disable()
+
+
+if workspace_mode:
+    render_workspace(load_workspace())
+    uploaded_file = None
+else:
+    uploaded_file = st.file_uploader("Choose a chat export (.txt, or the .zip WhatsApp makes; .gz and .zst work too)",
+                                     type=EXPORT_TYPES)
+
+
+if uploaded_file is not None:
+    if uploaded_file.name.endswith(archives.SUFFIXES):
+        with st.spinner("Processing your file. Please wait..."):
+            try:
+                with profiling.stage('load chat'):
+                    chat_key = cache.cache_key(uploaded_file)
+                    if out_of_core:
+                        df, start_date, last_date = load_dataset(chat_key, uploaded_file)
+                    else:
+                        df, start_date, last_date = load_chat(chat_key, uploaded_file)
+                # Results from the two backends are memoized apart.
+                data_key = chat_key + '-columnar' if out_of_core else chat_key
+
+
+                user_list = df.users if out_of_core else df['user'].unique().tolist()
+                if 'group_notification' in user_list:
+                    user_list.remove('group_notification')
+                user_list.sort()
+                user_list.insert(0,"Everyone")
+
+                selected_user = st.selectbox("Show analysis of:",user_list)
+
+                # The button only reads True on the run it was clicked in, so
+                # remember it; opening a section reruns the script.
+                if st.button("Show Analysis"):
+                    st.session_state['analysis_chat'] = chat_key
+
+                if st.session_state.get('analysis_chat') == chat_key:
+
+                    num_messages, words, num_media_messages, num_links = helper.fetch_stats(selected_user,df)
+
+                    col1, col2 = st.columns(2)
+
+                    with col1:
+                        st.metric("Total Messages", f"{num_messages}")
+                        st.metric("Total Words", words)
+                        st.metric("Most Active Chatter", helper.get_most_active_user(df))
+
+                    with col2:
+                        st.metric("Media Shared", num_media_messages)
+                        st.metric("Links Shared", num_links)
+                        total_days = (last_date - start_date).days + 1
+                        st.metric("Chat Duration", total_days)
+
+                    st.markdown(f"""
+                                   📈 Chat started from {start_date.strftime('%B %d, %Y')} to {last_date.strftime('%B %d, %Y')}
+
+                                   🏆 **{helper.get_most_active_user(df)}** has most number of messages !
+
+                                   """)
+
+                    sections = OUT_OF_CORE_SECTIONS if out_of_core else list(SECTION_DATA)
+                    opened = st.pills("Sections", sections, selection_mode="multi", default=DEFAULT_SECTIONS)
+
+                    for section in sections:
+                        if section not in opened or (section in EVERYONE_ONLY and selected_user != 'Everyone'):
+                            continue
+                        with st.expander(section, expanded=True):
+                            try:
+                                with st.spinner(f"Loading {section.lower()}..."), profiling.stage(f'section.{section}'):
+                                    data = section_data(data_key, selected_user, section, df)
+                                with profiling.stage(f'render.{section}'):
+                                    SECTION_RENDERERS[section](selected_user, data)
+                            except Exception as e:
+                                # One failing section should not hide the others.
+                                st.error(f"Error in {section.lower()}: {e}")
+
+
+
+            except Exception as e:
+                st.error(f"Error during preprocessing: {e}")
+
+
+profile_stack.close()
+if show_performance:
+    with st.sidebar:
+        st.markdown("## Performance")
+        timings = profiling.summary()
+        if timings.empty:
+            st.caption("Nothing was computed on this run; memoized sections are not re-timed.")
+        else:
+            st.dataframe(timings)
+        st.download_button("Download timings (JSON)", profiling.to_json(), "profile.json", "application/json")
+        if run_profile is not None:
+            st.download_button("Download cProfile stats", profiling.profile_bytes(run_profile), "run.prof")
+            with st.expander("Top functions"):
+                st.code(profiling.stats_text(run_profile))
@@ -1,59 +1,338 @@
-import re
-import pandas as pd
-
-def preprocess(data):
-    pattern = r'\d{1,2}/\d{1,2}/\d{2,4},\s\d{1,2}:\d{2}\s(?:AM|PM)\s-\s'
-
-    data = data.replace('\u202F', ' ')
-
-    messages = re.split(pattern, data)[1:]
-    dates = re.findall(pattern, data)
-
-    df = pd.DataFrame({'user_message': messages, 'message_date': dates})
-
-    df['message_date'] = pd.to_datetime(df['message_date'], format='%d/%m/%y, %I:%M %p - ', errors='coerce')
-
-    df.rename(columns={'message_date': 'date'}, inplace=True)
-
-    users = []
-    messages = []
-    for message in df['user_message']:
-        entry = re.split(r'([\w\W]+?):\s', message)
-        if entry[1:]:
-            users.append(entry[1])
-            messages.append(" ".join(entry[2:]))
-        else:
-            users.append('group_notification')
-            messages.append(entry[0])
-
-    df['user'] = users
-    df['message'] = messages
-    df['msg_length'] = df['message'].apply(len)
-    df.drop(columns=['user_message'], inplace=True)
-
-    df['only_date'] = df['date'].dt.date
-    df['year'] = df['date'].dt.year
-    df['month_num'] = df['date'].dt.month
-    df['month'] = df['date'].dt.month_name()
-    df['day'] = df['date'].dt.day
-    df['day_name'] = df['date'].dt.day_name()
-    df['hour'] = df['date'].dt.hour
-    df['minute'] = df['date'].dt.minute
-
-    period = []
-    for hour in df[['day_name', 'hour']]['hour']:
-        if hour == 23:
-            period.append(str(hour) + "-" + str('00'))
-        elif hour == 0:
-            period.append(str('00') + "-" + str(hour + 1))
-        else:
-            period.append(str(hour) + "-" + str(hour + 1))
-
-    df['period'] = df['hour'].apply(lambda h: f"{h}-00" if h == 23 else f"00-{h + 1}" if h == 0 else f"{h}-{h + 1}")
-
-    start_date = df['date'].min() if not df.empty else None
-    last_date = df['date'].max() if not df.empty else None
-
-    return df, start_date, last_date
-
-
+import codecs
+import io
+import itertools
+import re
+import pandas as pd
+
+import archives
+import profiling
+
+AUTHOR_PATTERN = re.compile(r'([\w\W]+?):\s')
+AUTHOR_EXTRACT_PATTERN = re.compile(r'^(?P<user>[\w\W]+?):\s(?P<message>[\w\W]*)$')
+
+# Bytes read from the upload per step, and messages collected before a batch is
+# turned into columns. Peak memory is roughly one chunk plus one batch plus the
+# frames already built.
+CHUNK_SIZE = 1 << 20
+BATCH_SIZE = 50_000
+
+# Characters read from the start of an export to work out which format it uses.
+SNIFF_SIZE = 8192
+
+# Each export format is a strftime-style header format. The header regex is built
+# from it, so a header that matches always parses with the same fixed format.
+FORMATS = {}
+DEFAULT_FORMAT = 'android_12h_dmy'
+
+_FORMAT_TOKENS = {
+    '%d': r'\d{1,2}',
+    '%m': r'\d{1,2}',
+    '%y': r'\d{2}',
+    '%Y': r'\d{4}',
+    '%H': r'\d{1,2}',
+    '%I': r'\d{1,2}',
+    '%M': r'\d{2}',
+    '%S': r'\d{2}',
+    '%p': r'(?:AM|PM|am|pm)',
+    ' ': r'\s',
+}
+
+
+def register_format(name, datetime_format):
+    pieces = re.split(r'(%\w| )', datetime_format)
+    pattern = ''.join(_FORMAT_TOKENS.get(piece, re.escape(piece)) for piece in pieces)
+    FORMATS[name] = {'pattern': re.compile(pattern), 'datetime_format': datetime_format}
+
+
+for _year_name, _year in (('', '%y'), ('_4y', '%Y')):
+    for _order, _date in (('dmy', f'%d/%m/{_year}'), ('mdy', f'%m/%d/{_year}')):
+        register_format(f'android_12h_{_order}{_year_name}', f'{_date}, %I:%M %p - ')
+        register_format(f'android_24h_{_order}{_year_name}', f'{_date}, %H:%M - ')
+        register_format(f'ios_12h_{_order}{_year_name}', f'[{_date}, %I:%M:%S %p] ')
+        register_format(f'ios_24h_{_order}{_year_name}', f'[{_date}, %H:%M:%S] ')
+    register_format(f'dotted_24h_dmy{_year_name}', f'%d.%m.{_year}, %H:%M - ')
+    register_format(f'dotted_ios_24h_dmy{_year_name}', f'[%d.%m.{_year}, %H:%M:%S] ')
+
+
+MONTH_NAMES = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+               'August', 'September', 'October', 'November', 'December']
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+PERIODS = [f"{h}-00" if h == 23 else f"00-{h + 1}" if h == 0 else f"{h}-{h + 1}" for h in range(24)]
+
+
+def _parsed_count(headers, chat_format):
+    parsed = pd.to_datetime(pd.Series(headers, dtype=object), format=FORMATS[chat_format]['datetime_format'],
+                            errors='coerce')
+    return int(parsed.notna().sum())
+
+
+def detect_format(lines):
+    # Picks the format whose headers both match and parse on the most sample
+    # lines. Day-first formats are registered first, so they win ties when the
+    # sample has no day above 12; read_export then settles the order.
+    best_name = None
+    best_count = 0
+    for name, chat_format in FORMATS.items():
+        headers = [match.group() for match in map(chat_format['pattern'].match, lines) if match]
+        if len(headers) <= best_count:
+            continue
+        count = _parsed_count(headers, name)
+        if count > best_count:
+            best_name, best_count = name, count
+
+    if best_name is None:
+        raise ValueError("Unrecognised chat export format")
+    return best_name
+
+
+def _other_order(name):
+    # The month/day twin of a day/month format and vice versa, if registered.
+    other = name.replace('_dmy', '_mdy') if '_dmy' in name else name.replace('_mdy', '_dmy')
+    return other if other != name and other in FORMATS else None
+
+
+def settle_order(chat_format, sample, lines):
+    # While every header seen parses both day/month and month/day, the order is
+    # a guess, and a wrong guess turns every later date past the 12th into NaT.
+    # Lines are read on, and kept in sample, until a header parses one way only.
+    other = _other_order(chat_format)
+    if other is None:
+        return chat_format
+
+    pattern = FORMATS[chat_format]['pattern']
+    new_lines = sample
+    while new_lines:
+        headers = [match.group() for match in map(pattern.match, new_lines) if match]
+        count, other_count = _parsed_count(headers, chat_format), _parsed_count(headers, other)
+        if count != other_count:
+            return chat_format if count > other_count else other
+        new_lines = _read_sample(lines)
+        sample.extend(new_lines)
+    return chat_format
+
+
+def _iter_str_lines(data):
+    start = 0
+    while start < len(data):
+        end = data.find('\n', start) + 1 or len(data)
+        yield data[start:end]
+        start = end
+
+
+def iter_lines(source, chunk_size=CHUNK_SIZE):
+    # Accepts a str, raw bytes or a binary file object (e.g. a Streamlit upload)
+    # and yields lines with their line endings kept. Compressed bytes are
+    # decompressed and decoded a chunk at a time, so neither the whole text nor
+    # the whole decompressed export is ever held.
+    if isinstance(source, str):
+        yield from _iter_str_lines(source)
+        return
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    if hasattr(source, 'seek'):
+        source.seek(0)
+        source = archives.open_export(source)
+
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    tail = ''
+    while True:
+        chunk = source.read(chunk_size)
+        text = tail + decoder.decode(chunk, final=not chunk)
+
+        start = 0
+        end = text.find('\n')
+        while end != -1:
+            yield text[start:end + 1]
+            start = end + 1
+            end = text.find('\n', start)
+        tail = text[start:]
+
+        if not chunk:
+            break
+
+    if tail:
+        yield tail
+
+
+def iter_batches(lines, pattern, batch_size=BATCH_SIZE):
+    # Yields {'message_date': [...], 'user_message': [...]} column batches. A
+    # message runs from its header line up to the next header, so continuation
+    # lines are glued on even when they arrive in a later chunk.
+    dates = []
+    messages = []
+    current_date = None
+    current_parts = []
+
+    for line in lines:
+        match = pattern.match(line)
+
+        if match is None:
+            if current_date is not None:
+                current_parts.append(line)
+            continue
+
+        if current_date is not None:
+            dates.append(current_date)
+            messages.append(''.join(current_parts))
+            if len(messages) >= batch_size:
+                yield {'message_date': dates, 'user_message': messages}
+                dates = []
+                messages = []
+
+        current_date = match.group()
+        current_parts = [line[match.end():]]
+
+    if current_date is not None:
+        dates.append(current_date)
+        messages.append(''.join(current_parts))
+
+    if messages:
+        yield {'message_date': dates, 'user_message': messages}
+
+
+def _split_author(message):
+    entry = AUTHOR_PATTERN.split(message)
+    if entry[1:]:
+        return entry[1], " ".join(entry[2:])
+    return 'group_notification', entry[0]
+
+
+def split_authors(user_message):
+    parts = user_message.str.extract(AUTHOR_EXTRACT_PATTERN)
+    users = parts['user'].fillna('group_notification')
+    messages = parts['message'].fillna(user_message)
+
+    # When the body holds another "<text>: " the old re.split joined the pieces
+    # back with extra spaces. Those rows are rare, so they keep the per-row split
+    # to stay byte-for-byte identical.
+    resplit = parts['user'].notna() & messages.str.contains(r'(?s).:\s')
+    if resplit.any():
+        messages[resplit] = [_split_author(message)[1] for message in user_message[resplit]]
+
+    return users, messages
+
+
+def _batch_to_frame(batch, datetime_format):
+    df = pd.DataFrame(batch)
+
+    with profiling.stage('preprocess.datetime_conversion', len(df)):
+        df['message_date'] = pd.to_datetime(df['message_date'], format=datetime_format, errors='coerce')
+
+    df.rename(columns={'message_date': 'date'}, inplace=True)
+
+    with profiling.stage('preprocess.author_split', len(df)):
+        df['user'], df['message'] = split_authors(df['user_message'])
+    df['msg_length'] = df['message'].str.len()
+    df.drop(columns=['user_message'], inplace=True)
+
+    return df
+
+
+def _empty_frame():
+    return pd.DataFrame({
+        'date': pd.Series(dtype='datetime64[ns]'),
+        'user': pd.Series(dtype=object),
+        'message': pd.Series(dtype=object),
+        'msg_length': pd.Series(dtype='int64'),
+    })
+
+
+def _lookup(codes, labels):
+    # Codes are NaN where the date failed to parse, which maps to a missing label.
+    return pd.Categorical.from_codes(codes.fillna(-1).astype('int8'), categories=labels)
+
+
+def add_calendar_columns(df, compact=False):
+    date = df['date'].dt
+
+    df['only_date'] = date.normalize() if compact else date.date
+    df['year'] = date.year
+    df['month_num'] = date.month
+    df['month'] = _lookup(df['month_num'] - 1, MONTH_NAMES)
+    df['day'] = date.day
+    df['day_name'] = _lookup(date.dayofweek, DAY_NAMES)
+    df['hour'] = date.hour
+    df['minute'] = date.minute
+    df['period'] = _lookup(df['hour'], PERIODS)
+
+    return df
+
+
+def compact_frame(df, arrow_messages=False):
+    # Low-cardinality strings become categoricals, calendar fields the smallest
+    # integer type that holds them (they stay float if a date failed to parse),
+    # and only_date a datetime64 column instead of Python date objects.
+    df['user'] = df['user'].astype('category')
+    df['month'] = pd.Categorical(df['month'], categories=MONTH_NAMES)
+    df['day_name'] = pd.Categorical(df['day_name'], categories=DAY_NAMES)
+    df['period'] = pd.Categorical(df['period'], categories=PERIODS)
+
+    for column in ('msg_length', 'year', 'month_num', 'day', 'hour', 'minute'):
+        df[column] = pd.to_numeric(df[column], downcast='integer')
+
+    df['only_date'] = df['date'].dt.normalize()
+
+    if arrow_messages:
+        df['message'] = df['message'].astype('string[pyarrow]')
+
+    return df
+
+
+def _read_sample(lines, size=SNIFF_SIZE):
+    sample = []
+    sample_size = 0
+    for line in lines:
+        sample.append(line)
+        sample_size += len(line)
+        if sample_size >= size:
+            break
+    return sample
+
+
+def read_export(data, chat_format=None, batch_size=BATCH_SIZE, chunk_size=CHUNK_SIZE):
+    # Raw (header, text) batches plus the format they were matched with, so
+    # callers can inspect or skip messages before paying for the full parse.
+    # iOS puts a left-to-right mark before the header of attachment and system
+    # lines.
+    lines = (line.replace('\u202F', ' ').removeprefix('\u200E') for line in iter_lines(data, chunk_size))
+    sample = _read_sample(lines)
+
+    if chat_format is None:
+        chat_format = settle_order(detect_format(sample), sample, lines) if sample else DEFAULT_FORMAT
+    pattern = FORMATS[chat_format]['pattern']
+
+    return iter_batches(itertools.chain(sample, lines), pattern, batch_size), chat_format
+
+
+def iter_frames(batches, chat_format):
+    # One date/user/message/msg_length frame per batch, without calendar columns.
+    datetime_format = FORMATS[chat_format]['datetime_format']
+    for batch in batches:
+        yield _batch_to_frame(batch, datetime_format)
+
+
+def build_frame(batches, chat_format, compact=False, arrow_messages=False):
+    with profiling.stage('preprocess.parse') as parse:
+        frames = list(iter_frames(batches, chat_format))
+        df = pd.concat(frames, ignore_index=True) if frames else _empty_frame()
+        parse['rows'] = len(df)
+
+    with profiling.stage('preprocess.calendar_columns', len(df)):
+        df = add_calendar_columns(df, compact)
+
+    if compact:
+        with profiling.stage('preprocess.compact', len(df)):
+            df = compact_frame(df, arrow_messages)
+    return df
+
+
+def preprocess(data, chat_format=None, batch_size=BATCH_SIZE, chunk_size=CHUNK_SIZE, compact=False,
+               arrow_messages=False):
+    batches, chat_format = read_export(data, chat_format, batch_size, chunk_size)
+    df = build_frame(batches, chat_format, compact, arrow_messages)
+
+    start_date = df['date'].min() if not df.empty else None
+    last_date = df['date'].max() if not df.empty else None
+
+    return df, start_date, last_date
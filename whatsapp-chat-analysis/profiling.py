@@ -0,0 +1,207 @@
+import cProfile
+import functools
+import io
+import json
+import marshal
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+import pandas as pd
+
+# CHAT_PROFILE=1 records wall time and rows per stage; CHAT_PROFILE=memory also
+# records peak traced memory, which slows everything down noticeably.
+_mode = os.environ.get('CHAT_PROFILE', '')
+_default_enabled = _mode not in ('', '0')
+_default_memory = _mode == 'memory'
+
+# Profiling is switched on and off per thread, and stages are recorded per
+# thread, so concurrent Streamlit sessions neither mix nor toggle each other.
+_local = threading.local()
+
+# tracemalloc is process-wide: it runs while any thread tracks memory, and is
+# only stopped here if it was started here. Its peak is process-wide too, so
+# threads tracking memory at the same time see each other's allocations.
+_tracing_lock = threading.Lock()
+_tracing_threads = set()
+_started_tracing = False
+
+
+def _set_tracing(tracing):
+    global _started_tracing
+    with _tracing_lock:
+        # A thread that ended while tracking (a Streamlit run stopped midway)
+        # no longer keeps tracemalloc running.
+        _tracing_threads.difference_update([thread for thread in _tracing_threads if not thread.is_alive()])
+        if tracing:
+            _tracing_threads.add(threading.current_thread())
+        else:
+            _tracing_threads.discard(threading.current_thread())
+
+        if _tracing_threads and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started_tracing = True
+        elif not _tracing_threads and _started_tracing:
+            tracemalloc.stop()
+            _started_tracing = False
+
+
+def _flags():
+    if not hasattr(_local, 'enabled'):
+        _local.enabled = _default_enabled
+        _local.track_memory = _default_memory
+        if _default_memory:
+            _set_tracing(True)
+    return _local
+
+
+def enable(memory=False):
+    # Pair with disable() on the same thread.
+    flags = _flags()
+    flags.enabled = True
+    if memory != flags.track_memory:
+        _set_tracing(memory)
+    flags.track_memory = memory
+
+
+def disable():
+    flags = _flags()
+    flags.enabled = False
+    flags.track_memory = False
+    _set_tracing(False)
+
+
+def is_enabled():
+    return _flags().enabled
+
+
+def _state():
+    if not hasattr(_local, 'records'):
+        _local.records = []
+        _local.stack = []
+    return _local
+
+
+def reset():
+    state = _state()
+    state.records = []
+    state.stack = []
+
+
+def records():
+    return list(_state().records)
+
+
+@contextmanager
+def _stage(name, rows):
+    state = _state()
+    track_memory = _flags().track_memory
+    frame = {'peak': 0}
+    if track_memory:
+        start_memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    parent = state.stack[-1] if state.stack else None
+    state.stack.append(frame)
+    started = time.perf_counter()
+    try:
+        yield frame
+    finally:
+        elapsed = time.perf_counter() - started
+        state.stack.pop()
+        record = {'stage': name, 'seconds': elapsed, 'rows': frame.get('rows', rows), 'depth': len(state.stack)}
+        if track_memory:
+            # reset_peak() in a nested stage hides its peak from the enclosing
+            # one, so each stage hands its peak up to its parent.
+            peak = max(tracemalloc.get_traced_memory()[1], frame['peak'])
+            record['peak_mib'] = (peak - start_memory) / 2 ** 20
+            if parent is not None:
+                parent['peak'] = max(parent['peak'], peak)
+        state.records.append(record)
+
+
+def stage(name, rows=None):
+    # Times the enclosed block as one stage. The yielded dict takes a 'rows'
+    # entry when the row count is only known inside the block.
+    if not _flags().enabled:
+        return nullcontext({})
+    return _stage(name, rows)
+
+
+def _rows(args, kwargs):
+    for value in (*args, *kwargs.values()):
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            return len(value)
+    return None
+
+
+def profiled(fn=None, name=None):
+    # Decorator form of stage(); rows are taken from the first frame or series
+    # argument.
+    if fn is None:
+        return functools.partial(profiled, name=name)
+
+    stage_name = name or fn.__qualname__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not _flags().enabled:
+            return fn(*args, **kwargs)
+        with _stage(stage_name, _rows(args, kwargs)):
+            return fn(*args, **kwargs)
+
+    return wrapper
+
+
+def summary(stage_records=None):
+    frame = pd.DataFrame(records() if stage_records is None else stage_records)
+    if frame.empty:
+        return frame
+    aggregations = {'calls': ('seconds', 'size'), 'seconds': ('seconds', 'sum'), 'rows': ('rows', 'sum')}
+    if 'peak_mib' in frame:
+        aggregations['peak_mib'] = ('peak_mib', 'max')
+    table = frame.groupby('stage', sort=False).agg(**aggregations)
+    return table.sort_values('seconds', ascending=False)
+
+
+def to_json(stage_records=None):
+    stage_records = records() if stage_records is None else stage_records
+    return json.dumps({
+        'memory': any('peak_mib' in record for record in stage_records),
+        'stages': stage_records,
+    }, indent=2)
+
+
+def export_json(path, stage_records=None):
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(to_json(stage_records))
+
+
+@contextmanager
+def cprofile(path=None):
+    # Deep-dive mode: a cProfile over the block, written as a .prof file that
+    # snakeviz or pstats can open. Stage names are only labels kept by stage()
+    # and profiled(); in the profile, and in py-spy, time shows up under the
+    # wrapped functions' own names.
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield profile
+    finally:
+        profile.disable()
+        if path is not None:
+            profile.dump_stats(path)
+
+
+def stats_text(profile, limit=30, sort='cumulative'):
+    output = io.StringIO()
+    pstats.Stats(profile, stream=output).sort_stats(sort).print_stats(limit)
+    return output.getvalue()
+
+
+def profile_bytes(profile):
+    # The same bytes dump_stats() would write, for downloads.
+    profile.create_stats()
+    return marshal.dumps(profile.stats)
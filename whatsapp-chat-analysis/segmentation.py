@@ -0,0 +1,55 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from profiling import profiled
+
+DEFAULT_GAP_MINUTES = 30
+
+# Every array is in chronological order; order maps it back to row positions of
+# the segmented frame (frame.iloc[order]). gaps and reply_latency are seconds,
+# NaN for the first message (and around unparsed dates). users holds codes into
+# names, which is sorted.
+Segments = namedtuple('Segments', ['order', 'users', 'names', 'gaps', 'session_ids', 'run_ids', 'reply_latency'])
+
+
+@profiled(name='segmentation.segment')
+def segment(dates, users, gap_minutes=DEFAULT_GAP_MINUTES):
+    values = dates.to_numpy(dtype='datetime64[ns]')
+    # Stable, so messages sharing a minute keep their export order.
+    order = np.argsort(values, kind='stable')
+    values = values[order]
+    n = len(values)
+
+    missing = np.isnat(values)
+    gaps = np.full(n, np.nan)
+    if n > 1:
+        gaps[1:] = np.diff(values.view('int64')) / 1e9
+        gaps[1:][missing[1:] | missing[:-1]] = np.nan
+
+    codes, names = pd.factorize(users.astype(object).to_numpy(), sort=True)
+    codes = codes[order]
+
+    changed = np.ones(n, dtype=bool)
+    changed[1:] = codes[1:] != codes[:-1]
+
+    session_ids = np.cumsum(gaps > gap_minutes * 60)
+    run_ids = np.cumsum(changed) - 1
+    reply_latency = np.where(changed, gaps, np.nan)
+
+    return Segments(order, codes, np.asarray(names, dtype=object), gaps, session_ids, run_ids, reply_latency)
+
+
+def same_author(segments):
+    # True where a message follows one by the same author.
+    same = np.zeros(len(segments.run_ids), dtype=bool)
+    same[1:] = segments.run_ids[1:] == segments.run_ids[:-1]
+    return same
+
+
+def in_frame_order(segments, values):
+    # Scatters a chronological array back to the frame's row order.
+    result = np.empty_like(values)
+    result[segments.order] = values
+    return result
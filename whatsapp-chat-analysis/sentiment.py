@@ -0,0 +1,104 @@
+import hashlib
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+import cache
+from profiling import profiled
+
+SENTIMENT_DB = os.path.join(cache.CACHE_DIR, 'sentiment.sqlite')
+
+# Below this many unscored messages the pool start-up (and a lexicon load per
+# worker) costs more than scoring in-process.
+POOL_MIN_MESSAGES = 20_000
+BATCH_SIZE = 5_000
+
+# SQLite's default limit on bound parameters per statement.
+_QUERY_CHUNK = 900
+
+_analyzer = None
+
+
+def _get_analyzer():
+    global _analyzer
+    if _analyzer is None:
+        from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+        _analyzer = SentimentIntensityAnalyzer()
+    return _analyzer
+
+
+def score_batch(messages):
+    analyzer = _get_analyzer()
+    return [analyzer.polarity_scores(message)["compound"] for message in messages]
+
+
+def message_hash(message):
+    return hashlib.blake2b(message.encode('utf-8'), digest_size=16).digest()
+
+
+def _connect():
+    os.makedirs(os.path.dirname(SENTIMENT_DB), exist_ok=True)
+    connection = sqlite3.connect(SENTIMENT_DB)
+    connection.execute('CREATE TABLE IF NOT EXISTS scores (hash BLOB PRIMARY KEY, compound REAL NOT NULL)')
+    return connection
+
+
+def load_scores(hashes):
+    known = {}
+    try:
+        with closing(_connect()) as connection, connection:
+            for start in range(0, len(hashes), _QUERY_CHUNK):
+                chunk = hashes[start:start + _QUERY_CHUNK]
+                placeholders = ','.join('?' * len(chunk))
+                rows = connection.execute(f'SELECT hash, compound FROM scores WHERE hash IN ({placeholders})', chunk)
+                known.update(rows)
+    except (OSError, sqlite3.Error):
+        pass
+    return known
+
+
+def store_scores(rows):
+    try:
+        with closing(_connect()) as connection, connection:
+            connection.executemany('INSERT OR IGNORE INTO scores (hash, compound) VALUES (?, ?)', rows)
+    except (OSError, sqlite3.Error):
+        # Scores that cannot be cached are simply recomputed next time.
+        pass
+
+
+def _score(messages, workers=None):
+    if workers == 1 or len(messages) < POOL_MIN_MESSAGES:
+        return score_batch(messages)
+
+    batches = [messages[start:start + BATCH_SIZE] for start in range(0, len(messages), BATCH_SIZE)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(chain.from_iterable(pool.map(score_batch, batches)))
+
+
+@profiled(name='sentiment.score_messages')
+def score_messages(messages, workers=None):
+    # Identical messages ("ok", "<Media omitted>") are scored once, and scores
+    # seen in earlier runs come from the on-disk cache.
+    codes, unique = pd.factorize(messages.astype(object))
+    hashes = [message_hash(message) for message in unique]
+
+    known = load_scores(hashes)
+    missing = [i for i, key in enumerate(hashes) if key not in known]
+    if missing:
+        scores = _score([unique[i] for i in missing], workers)
+        new_rows = [(hashes[i], score) for i, score in zip(missing, scores)]
+        store_scores(new_rows)
+        known.update(new_rows)
+
+    unique_scores = np.array([known[key] for key in hashes], dtype=float)
+    return pd.Series(unique_scores[codes], index=messages.index, name='sentiment_score')
+
+
+def label(scores):
+    labels = np.select([scores > 0.05, scores < -0.05], ["Positive", "Negative"], "Neutral")
+    return pd.Series(labels, index=scores.index, name='sentiment')
@@ -0,0 +1,124 @@
+import argparse
+import datetime
+import itertools
+import random
+
+import numpy as np
+import pandas as pd
+
+import preprocessor
+
+# Messages formatted per block; keeps memory flat when writing millions.
+BLOCK_SIZE = 100_000
+
+EMOJIS = ['😂', '❤️', '👍🏽', '🙏', '😭', '🔥', '👨‍👩‍👧', '🇮🇳', '🎉', '😅']
+URLS = [
+    'https://example.com/watch?v={n}',
+    'www.example.org/posts/{n}',
+    'http://maps.example.net/?q={n}',
+    'docs.python.org/3/library/{n}.html',
+]
+NOTIFICATIONS = [
+    '{a} added {b}',
+    '{a} left',
+    '{a} changed the subject from "plans" to "plans {n}"',
+    "{a} changed this group's icon",
+    '{a} removed {b}',
+]
+
+
+def _vocabulary(rng, size=2_000):
+    syllables = ['ka', 'lo', 'mi', 'ne', 'ra', 'to', 'shi', 'ban', 'dor', 'el', 'fu', 'gri', 'po', 'que', 'sa', 'vin']
+    words = {''.join(rng.choice(syllables) for _ in range(rng.randint(1, 4))) for _ in range(size * 2)}
+    common = ['the', 'a', 'to', 'and', 'is', 'you', 'i', 'it', 'ok', 'lol', 'yes', 'no', 'see', 'now', 'later']
+    return common + sorted(words)[:size]
+
+
+def _user_names(rng, users):
+    first = ['Alice', 'Bob', 'Chandra', 'Dee', 'Emeka', 'Farah', 'Goran', 'Hana', 'Ivan', 'Jia', 'Kofi', 'Lena']
+    names = []
+    for i in range(users):
+        if i % 5 == 4:
+            names.append(f'+91 9{rng.randrange(10 ** 4):04d} {rng.randrange(10 ** 5):05d}')
+        else:
+            names.append(f'{first[i % len(first)]} {chr(65 + i // len(first) % 26)}' if i >= len(first) else first[i])
+    return names
+
+
+def iter_export(messages=10_000, users=8, days=365, start=datetime.datetime(2021, 1, 1), multiline_rate=0.05,
+                emoji_rate=0.10, url_rate=0.03, media_rate=0.05, notification_rate=0.02,
+                chat_format=preprocessor.DEFAULT_FORMAT, seed=0):
+    # Yields the export text in blocks. The same arguments always give the same
+    # text, so benchmark inputs are reproducible.
+    rng = random.Random(seed)
+    names = _user_names(rng, users)
+    # A few members do most of the talking, as in real groups.
+    weights = [1 / (rank + 1) for rank in range(users)]
+    vocabulary = _vocabulary(rng)
+    # Zipf-like word frequencies, so the word index sees a realistic long tail.
+    word_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+    datetime_format = preprocessor.FORMATS[chat_format]['datetime_format']
+
+    offsets = np.sort(np.random.default_rng(seed).integers(0, days * 86_400, messages))
+    timestamps = pd.Timestamp(start) + pd.to_timedelta(offsets, unit='s')
+
+    for block_start in range(0, messages, BLOCK_SIZE):
+        headers = timestamps[block_start:block_start + BLOCK_SIZE].strftime(datetime_format)
+        lines = []
+        for i, header in enumerate(headers, block_start):
+            author = rng.choices(names, weights)[0]
+            if rng.random() < notification_rate:
+                body = rng.choice(NOTIFICATIONS).format(a=author, b=rng.choice(names), n=i)
+                lines.append(f'{header}{body}\n')
+                continue
+
+            if rng.random() < media_rate:
+                body = '<Media omitted>'
+            else:
+                body = ' '.join(rng.choices(vocabulary, cum_weights=word_weights, k=rng.randint(1, 20)))
+                if rng.random() < url_rate:
+                    body += ' ' + rng.choice(URLS).format(n=rng.randrange(10_000))
+                if rng.random() < emoji_rate:
+                    body += ' ' + ''.join(rng.choices(EMOJIS, k=rng.randint(1, 3)))
+                if rng.random() < multiline_rate:
+                    for _ in range(rng.randint(1, 3)):
+                        body += '\n' + ' '.join(rng.choices(vocabulary, cum_weights=word_weights, k=rng.randint(1, 8)))
+            lines.append(f'{header}{author}: {body}\n')
+        yield ''.join(lines)
+
+
+def generate(**params):
+    return ''.join(iter_export(**params))
+
+
+def user_messages(**params):
+    # The messages without their date headers, as split_authors sees them.
+    batches, _ = preprocessor.read_export(generate(**params))
+    return pd.Series([message for batch in batches for message in batch['user_message']])
+
+
+def write_export(path, **params):
+    with open(path, 'w', encoding='utf-8') as file:
+        for block in iter_export(**params):
+            file.write(block)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Write a synthetic WhatsApp chat export")
+    parser.add_argument('path')
+    parser.add_argument('-n', '--messages', type=int, default=10_000)
+    parser.add_argument('--users', type=int, default=8)
+    parser.add_argument('--days', type=int, default=365, help="date span")
+    parser.add_argument('--start', type=datetime.datetime.fromisoformat, default=datetime.datetime(2021, 1, 1))
+    parser.add_argument('--multiline-rate', type=float, default=0.05)
+    parser.add_argument('--emoji-rate', type=float, default=0.10)
+    parser.add_argument('--url-rate', type=float, default=0.03)
+    parser.add_argument('--media-rate', type=float, default=0.05)
+    parser.add_argument('--notification-rate', type=float, default=0.02)
+    parser.add_argument('--format', dest='chat_format', choices=sorted(preprocessor.FORMATS),
+                        default=preprocessor.DEFAULT_FORMAT)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    params = vars(args)
+    write_export(params.pop('path'), **params)
@@ -0,0 +1,84 @@
+import hashlib
+import os
+import uuid
+
+import cache
+from profiling import profiled
+
+WORD_CLOUD_DIR = os.path.join(cache.CACHE_DIR, 'wordclouds')
+MAX_FILES = 256
+
+WIDTH = 800
+HEIGHT = 400
+# The preview lays the words out on a canvas this many times smaller and draws
+# it scaled up to the full size; about 15x faster than the full layout.
+PREVIEW_SCALE = 4
+
+
+def render_key(frequencies, width=WIDTH, height=HEIGHT):
+    # Images are keyed by the frequency table they are drawn from, so the same
+    # chat and user (or any chat with the same top words) hit the same entry.
+    digest = hashlib.blake2b(f'{width}x{height}\n'.encode('utf-8'), digest_size=16)
+    for word, count in frequencies.items():
+        digest.update(f'{word}\t{count}\n'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _path(key):
+    return os.path.join(WORD_CLOUD_DIR, key + '.png')
+
+
+def is_cached(frequencies, width=WIDTH, height=HEIGHT):
+    return os.path.exists(_path(render_key(frequencies, width, height)))
+
+
+def _generate(frequencies, width, height, scale=1):
+    from wordcloud import WordCloud
+    cloud = WordCloud(width=width // scale, height=height // scale, scale=scale, background_color='white')
+    return cloud.generate_from_frequencies(frequencies.to_dict()).to_image()
+
+
+def _read(path):
+    from PIL import Image
+    try:
+        image = Image.open(path)
+        image.load()
+    except OSError:
+        return None
+    os.utime(path)
+    return image
+
+
+def evict(max_files=MAX_FILES):
+    entries = sorted((entry.stat().st_mtime, entry.path) for entry in os.scandir(WORD_CLOUD_DIR)
+                     if entry.name.endswith('.png'))
+    for _, path in entries[:max(len(entries) - max_files, 0)]:
+        os.remove(path)
+
+
+def _store(path, image):
+    try:
+        os.makedirs(WORD_CLOUD_DIR, exist_ok=True)
+        tmp_path = os.path.join(WORD_CLOUD_DIR, f'.{uuid.uuid4().hex}.tmp')
+        image.save(tmp_path, format='PNG')
+        os.replace(tmp_path, path)
+        evict()
+    except OSError:
+        pass
+
+
+@profiled(name='word_cloud.render')
+def render(frequencies, width=WIDTH, height=HEIGHT, preview=False):
+    # frequencies is a word -> count series. Previews are cheap enough that
+    # they are never cached.
+    if frequencies.empty:
+        return None
+    if preview:
+        return _generate(frequencies, width, height, PREVIEW_SCALE)
+
+    path = _path(render_key(frequencies, width, height))
+    image = _read(path)
+    if image is None:
+        image = _generate(frequencies, width, height)
+        _store(path, image)
+    return image
@@ -0,0 +1,47 @@
+import os
+from functools import lru_cache
+
+import pandas as pd
+
+import emoji_engine
+from profiling import profiled
+
+MEDIA_PLACEHOLDER = '<Media omitted>'
+
+# NLTK's English stopword list, shipped with the app so nothing is downloaded
+# at startup.
+STOPWORDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stopwords_english.txt')
+
+
+@lru_cache(maxsize=None)
+def load_stopwords():
+    with open(STOPWORDS_PATH, encoding='utf-8') as file:
+        return frozenset(line.strip() for line in file if line.strip())
+
+
+def word_counts(messages):
+    # Same count as len(message.split()) without building the word lists.
+    return messages.str.count(r'\S+').astype('int64')
+
+
+@profiled(name='word_index.term_frequencies')
+def term_frequencies(messages, users, stop_words=frozenset()):
+    # Per-user counts of lowercased words, with emoji, media placeholders and
+    # stopwords left out. Indexed by (user, word).
+    keep = ~messages.str.contains(MEDIA_PLACEHOLDER, regex=False).astype(bool)
+    messages = messages[keep]
+
+    words = emoji_engine.strip(messages).str.lower().str.split().explode().dropna()
+    words = words[~words.isin(stop_words)]
+
+    frame = pd.DataFrame({'user': users.loc[words.index].to_numpy(), 'word': words.to_numpy()})
+    return frame.groupby(['user', 'word'], observed=True).size().rename('frequency')
+
+
+def frequencies(table, users=None):
+    # Word frequencies summed over the given users (all of them when None),
+    # most frequent first.
+    if users is not None:
+        table = table[table.index.get_level_values('user').isin(users)]
+    totals = table.groupby(level='word').sum()
+    return totals.sort_values(ascending=False, kind='stable')
@@ -0,0 +1,193 @@
+import argparse
+import datetime
+import json
+import os
+
+import pandas as pd
+
+import archives
+import cache
+import incremental
+
+WORKSPACE_DIR = os.environ.get('CHAT_WORKSPACE_DIR', os.path.join(cache.CACHE_DIR, 'workspace'))
+
+# Bump when the index tables change shape; the index is then rebuilt from the
+# chat store.
+INDEX_VERSION = 1
+
+# The cross-chat index: each chat's additive aggregates rolled up to these
+# columns and stacked under a leading 'chat' column. Views read only this,
+# never the message rows.
+INDEXES = {
+    'activity': ['chat', 'user', 'date', 'messages', 'msg_length'],
+    'sentiment': ['chat', 'user', 'sentiment', 'messages'],
+}
+
+
+def _index_table(name, tables):
+    if name == 'activity':
+        return tables['activity'].groupby(level=['user', 'date']).sum()
+    return tables[name]
+
+
+class Workspace:
+    # Many chats in one place: each export is ingested into the incremental
+    # chat store, and its aggregates are added to the cross-chat index.
+
+    def __init__(self, directory=WORKSPACE_DIR):
+        self.directory = directory
+        self.chats = self._load_chats()
+        self._index = None
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _load_chats(self):
+        try:
+            with open(self._path('chats.json'), encoding='utf-8') as file:
+                registry = json.load(file)
+        except (OSError, ValueError):
+            return {}
+        return registry['chats'] if registry.get('version') == INDEX_VERSION else {}
+
+    def _store_chats(self):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self._path('.chats.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump({'version': INDEX_VERSION, 'chats': self.chats}, file, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self._path('chats.json'))
+
+    @property
+    def index(self):
+        # Loaded once per workspace object, then kept in memory.
+        if self._index is None:
+            self._index = {}
+            for name, columns in INDEXES.items():
+                try:
+                    table = pd.read_parquet(self._path(name + '.parquet'))
+                except (OSError, ValueError):
+                    table = pd.DataFrame(columns=columns)
+                self._index[name] = table[table['chat'].isin(self.chats)]
+        return self._index
+
+    def _store_index(self):
+        os.makedirs(self.directory, exist_ok=True)
+        for name, table in self._index.items():
+            tmp_path = self._path(f'.{name}.parquet.tmp')
+            table.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, self._path(name + '.parquet'))
+
+    def _unique_name(self, name, key):
+        taken = {chat['name'] for other, chat in self.chats.items() if other != key}
+        unique = name
+        number = 2
+        while unique in taken:
+            unique = f'{name} ({number})'
+            number += 1
+        return unique
+
+    def add(self, source, name, chat_format=None):
+        # Adding a newer export of a chat already here parses only its new
+        # messages and replaces the chat's rows in the index. Returns the chat's
+        # id, or None for an empty export.
+        key = incremental.identify(source, chat_format)
+        if key is None:
+            return None
+
+        df, start_date, last_date, tables = incremental.ingest(source, key=key, chat_format=chat_format)
+        message_count = len(df)
+        del df
+
+        index = self.index
+        for table_name, columns in INDEXES.items():
+            rows = _index_table(table_name, tables).reset_index()
+            rows.insert(0, 'chat', key)
+            kept = index[table_name][index[table_name]['chat'] != key]
+            index[table_name] = pd.concat([kept, rows[columns]], ignore_index=True) if len(kept) else rows[columns]
+
+        users = index['activity'].loc[index['activity']['chat'] == key, 'user']
+        self.chats[key] = {
+            'name': self._unique_name(name, key),
+            'messages': message_count,
+            'members': int(users[users != 'group_notification'].nunique()),
+            'start_date': None if start_date is None else start_date.isoformat(),
+            'last_date': None if last_date is None else last_date.isoformat(),
+            'updated': datetime.datetime.now().isoformat(timespec='seconds'),
+        }
+        self._store_index()
+        self._store_chats()
+        return key
+
+    def remove(self, key):
+        # Drops the chat from the workspace; its store is left as a cache.
+        self.chats.pop(key, None)
+        for name, table in self.index.items():
+            self._index[name] = table[table['chat'] != key]
+        self._store_index()
+        self._store_chats()
+
+    def _named(self, table):
+        # Chat id columns become the chats' names, in the order they were added.
+        names = {key: chat['name'] for key, chat in self.chats.items() if key in table.columns}
+        return table[list(names)].rename(columns=names).rename_axis(columns='chat')
+
+    def summary(self):
+        frame = pd.DataFrame.from_dict(self.chats, orient='index')
+        if frame.empty:
+            return frame
+        frame = frame.rename_axis('chat_id').reset_index().set_index('name')
+        return frame[['messages', 'members', 'start_date', 'last_date', 'updated', 'chat_id']]
+
+    def user_activity(self, users=None, value='messages'):
+        # Messages per user (rows) in each chat (columns).
+        activity = self.index['activity']
+        if users is not None:
+            activity = activity[activity['user'].isin(users)]
+        table = activity.groupby(['user', 'chat'])[value].sum().unstack(fill_value=0)
+        table = self._named(table)
+        return table.loc[table.sum(axis=1).sort_values(ascending=False, kind='stable').index]
+
+    def volume_timeline(self, freq='M', value='messages'):
+        # Messages per period (rows) in each chat (columns).
+        activity = self.index['activity']
+        periods = pd.to_datetime(activity['date']).dt.to_period(freq).dt.start_time.rename('period')
+        table = activity.groupby([periods, activity['chat']])[value].sum().unstack(fill_value=0)
+        return self._named(table)
+
+    def top_users(self, n=10):
+        # The busiest members across every chat, with how many chats they are in.
+        activity = self.index['activity']
+        activity = activity[activity['user'] != 'group_notification']
+        per_chat = activity.groupby(['user', 'chat'])['messages'].sum()
+        top = per_chat.groupby(level='user').agg(messages='sum', chats='size')
+        return top.sort_values('messages', ascending=False, kind='stable').head(n)
+
+    def sentiment_by_chat(self):
+        # Share of positive, neutral and negative messages in each chat.
+        sentiment = self.index['sentiment']
+        table = sentiment.groupby(['chat', 'sentiment'])['messages'].sum().unstack(fill_value=0)
+        table = table.div(table.sum(axis=1), axis=0)
+        return self._named(table.T).T.rename_axis(columns='sentiment')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Add chat exports to a workspace and compare them")
+    parser.add_argument('--dir', default=WORKSPACE_DIR, help="workspace directory")
+    commands = parser.add_subparsers(dest='command', required=True)
+    add_parser = commands.add_parser('add', help="ingest exports; a chat already added is updated")
+    add_parser.add_argument('paths', nargs='+')
+    commands.add_parser('report', help="print the cross-chat views")
+    args = parser.parse_args()
+
+    workspace = Workspace(args.dir)
+    if args.command == 'add':
+        for path in args.paths:
+            with open(path, 'rb') as file:
+                key = workspace.add(file, archives.chat_name(path))
+            print(f"  {path}: {'empty' if key is None else workspace.chats[key]['name']}")
+    else:
+        with pd.option_context('display.width', 200, 'display.max_columns', 20):
+            print(workspace.summary().to_string(), end='\n\n')
+            print(workspace.top_users().to_string(), end='\n\n')
+            print(workspace.volume_timeline().tail(12).to_string(), end='\n\n')
+            print(workspace.sentiment_by_chat().round(3).to_string())